@@ -1,13 +1,31 @@
 #!/usr/bin/env python3
 
-# Uncomment for use of pi
-import RPi.GPIO as GPIO
-#import Mock.GPIO as GPIO
+import signal
+
+# abort() calls so far, a shot armed across one of them is refused
+aborts = 0
+
+def abortpending(signum, frame):
+    """SIGUSR1 before the shot can be aborted: count it, arm() then refuses"""
+    global aborts
+    aborts += 1
+
+if __name__=='__main__':
+    # the GUI may signal an abort while the imports below are still running
+    signal.signal(signal.SIGUSR1, abortpending)
+
+from SIOgpio import GPIO
 #import Adafruit_DHT
 import time, threading
 import argparse
-import sys, select
+import sys
 import SIOpinlist as pin
+import SIOclient
+import SIOsequencer
+import SIOedges
+import SIOwaves
+import SIOrealtime
+import SIOcalibrate
 
 def cannonforward(cannonposition):
     print("Advancing the cannon")
@@ -24,28 +42,15 @@ def cannonreverse(cannonposition,cannonreversedelay):
     print("reversing the cannon")
     GPIO.output(cannonposition,GPIO.LOW)
 
-def timeprocess(irsensor,exittime):
-    tic = time.time()
-    print('***',exittime)
-    
-    while GPIO.input(irsensor)==0 and time.time()-tic<exittime:
-        pass
-    toc=time.time()
-
-    #print GPIO.input(pin.irsensor)
-    total = toc - tic
-    print("Time from start to immersion:", total)
-
-        
-def applysample(cannon,wait,duration):
-    time.sleep(wait)
-    GPIO.output(cannon,GPIO.HIGH)
-    time.sleep(duration)
-    GPIO.output(cannon,GPIO.LOW)
-    
-def releaseplunger(plunger,wait):
-    time.sleep(wait)
-    GPIO.output(plunger,GPIO.HIGH)
+def timeprocess(immersion,exittime,delay=0):
+    total = immersion.result()
+    if total is not None:
+        total -= delay / 1e9    # from the start of the cycle as requested
+    if total is None:
+        print("No immersion detected within", exittime, "s")
+    else:
+        print("Time from start to immersion:", total)
+    return total
 
 def resetplunger(plunger):
     GPIO.output(plunger,GPIO.LOW)
@@ -54,20 +59,7 @@ def resetplunger(plunger):
 #    humidity, temperature = Adafruit_DHT.read_retry(22, pin=dht22)
 #    return humidity, temperature
     
-if __name__=='__main__':
-    parser = argparse.ArgumentParser(description='Arguments for SIOcontrol')
-    parser.add_argument('--stime',      help='Duration of sample application (seconds)',type=float,required=True)
-    parser.add_argument('--sdelay',     help='Time to wait before applying (seconds)',default = 0, type=float,required=False)
-    parser.add_argument('--pdelay',     help='Time to wait before plunging (seconds)',default = 0, type=float,required=False)
-    parser.add_argument('--donotplunge',help='Do not fire the plunger (diagnostic)',action = 'store_true')  
-    args = parser.parse_args()
-    
-    # Default timing
-    cannontimetoreverse = 0.000
-    cannonreversedelay  = args.stime + args.sdelay+ cannontimetoreverse
-    timeout             = 1     # withdraw the plunger to avoid overheating
-    kuhnketime          = 1
-
+def setuppins():
     GPIO.setwarnings(False)
       
     GPIO.setmode(GPIO.BCM)
@@ -77,6 +69,63 @@ if __name__=='__main__':
     GPIO.setup(pin.sensorpower,GPIO.OUT)
     GPIO.setup(pin.irsensor,GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
     GPIO.setup(pin.interlock,GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
+
+class Shot:
+    """An armed cycle: checked, sensors powered and its edge list computed"""
+    def __init__(self, edges, exittime, waves, realtime=False, delay=0):
+        self.edges = edges
+        self.exittime = exittime
+        self.delay = delay      # ns from the first edge to the requested start, see SIOsequencer.compensate()
+        self.waves = waves
+        self.realtime = realtime
+        self.cancel = SIOsequencer.Cancel()
+        # immersion time comes from the IR sensor edge timestamp, nothing polls it
+        self.immersion = SIOedges.ImmersionTimer(pin.irsensor)
+        # from now until disarmed, lifting the container aborts the shot
+        self.watchdog = SIOedges.InterlockWatchdog(lambda timestamp: self.cancel.abort(GPIO.output, timestamp),
+                                                   pin.interlock)
+
+    def disarm(self):
+        global current
+        self.immersion.result()
+        self.watchdog.stop()
+        with lock:
+            if current is self:
+                current = None
+
+# shot armed or being fired, abort() stops it from any thread
+current = None
+# not reentrant: abort() must not run in a signal handler, see __main__
+lock = threading.Lock()
+
+def abort(received=None):
+    """Cancel the pending edges of the shot armed or being fired (a shot being
+    armed is refused) and drive the cannon, spray and plunger safe, also when
+    there is none; received is the monotonic ns time the abort came in,
+    returns ns from then until safe
+    """
+    global aborts
+    received = received or time.monotonic_ns()
+    with lock:
+        aborts += 1
+        shot = current
+    if shot is not None:
+        shot.cancel.abort(GPIO.output, received)
+    else:
+        for p, level in SIOsequencer.SAFE.items():
+            GPIO.output(p, level)
+    return time.monotonic_ns() - received
+
+def arm(stime, sdelay=0, pdelay=0, donotplunge=False, kuhnketime=1, waves=False, realtime=False,
+        feedforward=True, since=None):
+    """Everything of a cycle that can happen before the first edge, None if it was refused;
+    feedforward compensates the latencies of the SIOcalibrate profile, if there is one.
+    It is refused if abort() was called since `since` (an abort count, default now)
+    """
+    since = aborts if since is None else since
+    # Default timing
+    cannontimetoreverse = 0.000
+    cannonreversedelay  = stime + sdelay+ cannontimetoreverse
         
     # Report environmental conditions
 #    humidity, temperature = readenvironment(pin.dht22)
@@ -84,44 +133,150 @@ if __name__=='__main__':
 
     # Display timing and avoid crash
     print("Timings:")
-    print("Specimen application will start at time: ",args.sdelay)
-    print("Specimen application will end at time: ",args.sdelay + args.stime)
+    print("Specimen application will start at time: ",sdelay)
+    print("Specimen application will end at time: ",sdelay + stime)
     print("Cannon will reverse at time: ",cannonreversedelay)
-    print("Plunger will fall at time: ",args.pdelay)
-    exittime = kuhnketime+args.pdelay+args.sdelay
-    print("Program will exit after: ",exittime)
-    if cannonreversedelay > args.pdelay:
-        print("The cannon does not have sufficient time to reverse before plunging!!")
-        exit()
-
-    # Check interlock
+    print("Plunger will fall at time: ",pdelay)
+    print("Program will exit after: ",kuhnketime+pdelay+sdelay)
+    latencies = SIOcalibrate.latencies() if feedforward else ()
+    for p, latency in latencies:
+        print(f"Pin {p} fires {latency / 1e6:.2f} ms early for its calibrated latency")
+    # every edge of the cycle gets an absolute deadline from one t0
+    try:
+        plan = SIOsequencer.plan(stime, sdelay, pdelay, donotplunge, kuhnketime, latencies)
+    except ValueError as error:
+        print(error)
+        return None
+    if latencies:
+        print("Commands go out at, fed forward:")
+        for edge in plan.edges:
+            print(f"  {edge.name:<17} {(edge.offset - plan.delay) / 1e6:10.3f} ms")
+    return armplan(plan, waves, realtime, since)
+
+def armplan(plan, waves=False, realtime=False, since=None):
+    """Power up and check the interlock for a checked SIOsequencer.Plan, None if refused;
+    realtime fires it in SIOrealtime mode. It is refused if abort() was called
+    since arming began, `since` is the abort count then
+    """
+    global current
+    since = aborts if since is None else since
+    # Power up sensors and check interlock
+    powerupsensors(pin.sensorpower)
     if GPIO.input(pin.interlock)==1:
         print("Interlock fail: cryogen container is not in place")
         powerdownsensors(pin.sensorpower)
         cannonreverse(pin.cannonposition,0)
-        exit()
+        return None
     else:
         print("Safety interlock pass: cryogen container is in place")
 
-    # set up processes
-    sample = threading.Thread(target=applysample, args=(pin.cannon,args.sdelay,args.stime))  
-    plunger = threading.Thread(target=releaseplunger, args=(pin.plunger,args.pdelay))  
-    cannonposition = threading.Thread(target=cannonreverse, args=(pin.cannonposition,cannonreversedelay))
-    clockit = threading.Thread(target=timeprocess, args=(pin.irsensor,exittime))
-    
-    # start processes
-    if not args.donotplunge:
-        plunger.start()
-        
-    sample.start()  
-    cannonposition.start()
-    clockit.start()
+    if realtime:
+        SIOrealtime.prepare()
+    # a thread spinning towards an edge holds the GIL for up to the switch
+    # interval (5 ms by default), an abort or interlock edge must not wait that long
+    sys.setswitchinterval(0.0001)
+    shot = Shot(plan.edges, plan.exittime, waves, realtime, plan.delay)
+    with lock:
+        # published first: an abort from now on cancels it, one before was counted
+        current = shot
+        refused = aborts != since
+    if refused:
+        shot.disarm()
+        print("Aborted while arming")
+        return None
+    return shot
+
+def fire(shot, received=None, output=None):
+    """Fire an armed shot; received is the monotonic ns time the command came in,
+    output(pin, level) replaces GPIO.output (it must call it)
+    returns False if it was refused or aborted, otherwise the immersion time
+    (None if the IR sensor did not fire), t0 in monotonic ns and the edges as
+    (name, scheduled, actual) in s from t0. t0 is the start of the cycle as
+    requested, with latency compensation the first edges go out before it
+    """
+    # the container may have moved since arming, reading it costs microseconds
+    if GPIO.input(pin.interlock)==1:
+        print("Interlock fail: cryogen container is not in place")
+        shot.disarm()
+        return False
+    if shot.cancel.is_set():
+        print("Aborted before the first edge")
+        shot.disarm()
+        return False
+
+    output = output or GPIO.output
+    # t0 is taken inside the window, entering it must not delay the first edge
+    with SIOrealtime.RealTime(shot.realtime):
+        t0 = time.monotonic_ns()
+        shot.immersion.start(t0)
+        if shot.waves:
+            # hardware-timed: the whole cycle goes to the DMA wave engine
+            fired = SIOwaves.fire(shot.edges, output, t0, cancel=shot.cancel)
+        else:
+            fired = SIOsequencer.fire(shot.edges, output, t0, shot.cancel)
+    start = t0 + shot.delay
+    if shot.cancel.is_set():
+        latency = shot.cancel.latency()
+        # again, an edge may have been on its way out when the abort came in
+        shot.cancel.abort(GPIO.output)
+        shot.disarm()
+        SIOsequencer.report(fired, start)
+        if shot.watchdog.opened is not None:
+            print("Interlock fail: cryogen container moved during the shot")
+        if latency is None:
+            print("Aborted before the first edge")
+        else:
+            print(f"Aborted after {len(fired)} of {len(shot.edges)} edges, "
+                  f"pins safe {latency / 1e3:.1f} us after the "
+                  f"{'abort' if shot.watchdog.opened is None else 'interlock opened'}")
+        return False
+    total = timeprocess(shot.immersion, shot.exittime, shot.delay)
+    shot.disarm()
+    SIOsequencer.report(fired, start)
+    if received is not None:
+        edge, scheduled, actual = fired[0]
+        print(f"Latency from command to first edge: {(actual - edge.offset - received) / 1e3:.1f} us")
+    return {'immersion': total, 't0': start,
+            'edges': [(edge.name, (scheduled - start) / 1e9, (actual - start) / 1e9)
+                      for edge, scheduled, actual in fired]}
+
+def applyandplunge(stime, sdelay=0, pdelay=0, donotplunge=False, kuhnketime=1, waves=False, realtime=False,
+                   feedforward=True, since=None):
+    """Arm and fire one spray and plunge cycle on configured pins, see fire()"""
+    shot = arm(stime, sdelay, pdelay, donotplunge, kuhnketime, waves, realtime, feedforward, since)
+    if shot is None:
+        return False
+    return fire(shot)
     
-    # Kuhnke plunger
-    time.sleep(kuhnketime+args.pdelay+args.sdelay)
-    resetplunger(pin.plunger)
-    powerdownsensors(pin.sensorpower)
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOcontrol')
+    parser.add_argument('--stime',      help='Duration of sample application (seconds)',type=float,required=True)
+    parser.add_argument('--sdelay',     help='Time to wait before applying (seconds)',default = 0, type=float,required=False)
+    parser.add_argument('--pdelay',     help='Time to wait before plunging (seconds)',default = 0, type=float,required=False)
+    parser.add_argument('--donotplunge',help='Do not fire the plunger (diagnostic)',action = 'store_true')  
+    parser.add_argument('--waves',      help='Time the edges with pigpio DMA waves',action = 'store_true')
+    parser.add_argument('--realtime',   help='Fire with SCHED_FIFO, a pinned core, locked memory and no GC',action = 'store_true')
+    parser.add_argument('--nofeedforward',help='Ignore the SIOcalibrate latency profile',action = 'store_true')
+    args = parser.parse_args()
 
+    # hand the cycle to SIOdaemon if it is running, it keeps the pins configured
+    if SIOclient.available():
+        params = vars(args)
+        params['feedforward'] = not params.pop('nofeedforward')
+        reply = SIOclient.run('applyandplunge', **params)
+        sys.exit(0 if reply.get('done') else 1)
+
+    setuppins()
+    # SIGUSR1 aborts the shot, for a GUI that started this script without SIOdaemon.
+    # In a thread: run in the handler it could interrupt fire() between its
+    # check and an output, which would then still be driven after the abort
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=abort).start())
+    # a signal counted by abortpending() refuses the shot
+    ok = applyandplunge(args.stime, args.sdelay, args.pdelay, args.donotplunge, waves=args.waves,
+                        realtime=args.realtime, feedforward=not args.nofeedforward, since=0)
+
+    SIOedges.stopall()
     GPIO.cleanup()
+    if not ok:
+        sys.exit(1)
     print("Done!")
-
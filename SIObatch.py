@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# unattended parameter sweeps: runs a queue of spray and plunge shots over a
+# grid or list of stime/sdelay/pdelay, cleans between shots and only stops at
+# operator checkpoints (loading the next grid, interlock failures). Every shot
+# is recorded in a CSV file.
+#
+# sweep file (JSON), either a grid
+#   {"stime": [0.005, 0.01], "pdelay": [0.05, 0.1], "sdelay": 0,
+#    "repeats": 2, "clean": {"stime": 0.2, "cycles": 5}}
+# or a list of shots
+#   {"shots": [{"stime": 0.005, "pdelay": 0.05}, ...], "clean": null}
+
+import csv, json, itertools
+import argparse
+from datetime import datetime
+import SIOclient
+
+SHOT_KEYS = ('stime', 'sdelay', 'pdelay', 'donotplunge')
+DEFAULT_CLEAN = {'stime': 0.2, 'cycles': 5}
+
+def loadsweep(path):
+    """Shots of the sweep as a list of dicts, and the cleaning between shots"""
+    with open(path) as f:
+        sweep = json.load(f)
+    if 'shots' in sweep:
+        shots = sweep['shots']
+    else:
+        axes = [key for key in SHOT_KEYS if key in sweep]
+        values = [sweep[key] if isinstance(sweep[key], list) else [sweep[key]] for key in axes]
+        shots = [dict(zip(axes, combination)) for combination in itertools.product(*values)]
+    shots = [shot for shot in shots for repeat in range(sweep.get('repeats', 1))]
+    for shot in shots:
+        unknown = set(shot) - set(SHOT_KEYS)
+        if unknown or 'stime' not in shot:
+            raise ValueError(f"bad shot {shot}: needs stime, may have {', '.join(SHOT_KEYS)}")
+    return shots, sweep.get('clean', DEFAULT_CLEAN)
+
+class Runner:
+    """Sends commands to SIOdaemon, or runs them in this process without one"""
+    def __init__(self):
+        self.daemon = SIOclient.available()
+        if not self.daemon:
+            import SIOdaemon, SIOapplyandplunge
+            SIOapplyandplunge.setuppins()
+            self.commands = SIOdaemon.COMMANDS
+
+    def __call__(self, cmd, **params):
+        """(ok, result) of the command"""
+        if self.daemon:
+            reply = SIOclient.run(cmd, **params)
+            return bool(reply.get('done')), reply.get('result')
+        ok = self.commands[cmd](params)
+        return bool(ok), ok if isinstance(ok, dict) else None
+
+    def close(self):
+        """Release the pins when this process drove them"""
+        if not self.daemon:
+            import SIOedges
+            from SIOgpio import GPIO
+            SIOedges.stopall()
+            GPIO.cleanup()
+
+def checkpoint(message, ask):
+    """Wait for the operator: '' continue, 's' skip the shot, 'q' stop the sweep"""
+    if not ask:
+        return ''
+    answer = input(f"{message} [Enter = go, s = skip, q = quit] ").strip().lower()
+    return answer[:1]
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIObatch')
+    parser.add_argument('sweep',        help='Sweep definition (JSON)')
+    parser.add_argument('--out',        help='CSV file for the results',
+                        default = datetime.now().strftime('SIObatch_%Y%m%d_%H%M%S.csv'), required=False)
+    parser.add_argument('--noprompt',   help='Do not stop for the operator between shots (diagnostic)',action = 'store_true')
+    args = parser.parse_args()
+
+    shots, clean = loadsweep(args.sweep)
+    print(f"[SIObatch] {len(shots)} shots, results to {args.out}")
+    run = Runner()
+
+    try:
+        with open(args.out, 'w', newline='') as f:
+            results = csv.writer(f)
+            results.writerow(['shot', 'time', 'stime', 'sdelay', 'pdelay', 'donotplunge', 'status', 'immersion'])
+            for number, shot in enumerate(shots, 1):
+                params = {'sdelay': 0, 'pdelay': 0, 'donotplunge': False, **shot}
+                status, immersion = 'skipped', ''
+                answer = checkpoint(f"Shot {number}/{len(shots)} {shot}: load the next grid", not args.noprompt)
+                while answer == '':
+                    ok, _ = run('powerupdown', updown='up')
+                    if not ok:
+                        answer = checkpoint("Interlock failed, seat the cryogen container", True)
+                        continue
+                    ok, result = run('applyandplunge', **params)
+                    status = 'ok' if ok else 'refused'
+                    if result and result['immersion'] is not None:
+                        immersion = result['immersion']
+                    break
+                results.writerow([number, datetime.now().isoformat(timespec='seconds'), params['stime'],
+                                  params['sdelay'], params['pdelay'], params['donotplunge'], status, immersion])
+                f.flush()
+                if answer == 'q':
+                    break
+                if clean and status == 'ok' and number < len(shots):
+                    run('clean', **clean)
+
+        run('powerupdown', updown='down')
+    finally:
+        run.close()
+    print("[SIObatch] Sweep done")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# timing-jitter benchmark for the spray and plunge sequence: runs the real
+# SIOapplyandplunge code against the recording GPIO stand-in over a matrix of
+# stime/sdelay/pdelay values and reports per-edge error percentiles, the skew
+# between the call and t0 and the CPU use. Needs no Pi. With --realtime every
+# parameter set also runs in SIOrealtime mode and the two are compared.
+
+import SIOmockgpio
+GPIO = SIOmockgpio.install()
+
+import io, sys, time, json, itertools
+import argparse
+from contextlib import redirect_stdout
+import SIOsequencer
+import SIOwaves
+import SIOapplyandplunge
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+def summary(values):
+    """p50/p99/max of the absolute values in us"""
+    values = [abs(v) / 1e3 for v in values]
+    return {'p50': percentile(values, 0.5), 'p99': percentile(values, 0.99), 'max': max(values)}
+
+def runcase(stime, sdelay, pdelay, runs, kuhnketime, waves=False, realtime=False):
+    """Run one parameter set, return {name: [error ns]} or None if the sequence refuses it"""
+    samples = {}
+    cpu = []
+    t0s = []
+    engine = SIOwaves if waves else SIOsequencer
+    fire = engine.fire
+    def recordingfire(edges, output, t0=None, cancel=None):
+        t0s.append(t0)
+        return fire(edges, output, t0, cancel=cancel)
+
+    edges = SIOsequencer.sprayandplunge(stime, sdelay, pdelay, False, kuhnketime)
+    engine.fire = recordingfire
+    try:
+        for run in range(runs):
+            GPIO.clear()
+            del t0s[:]
+            called = time.monotonic_ns()
+            tic, clock = time.perf_counter(), time.process_time()
+            with redirect_stdout(io.StringIO()):
+                ok = SIOapplyandplunge.applyandplunge(stime, sdelay, pdelay, False, kuhnketime, waves, realtime,
+                                                      feedforward=False)
+            cpu.append((time.process_time() - clock) / (time.perf_counter() - tic))
+            if not ok:
+                return None
+
+            t0 = t0s[0]
+            samples.setdefault('start skew', []).append(t0 - called)
+            # edges due at the same time may be driven in any order
+            records = {}
+            for timestamp, channel, level in GPIO.records:
+                if timestamp >= t0:
+                    records.setdefault((channel, level), []).append(timestamp)
+            actual = {}
+            for edge in edges:
+                if not records.get((edge.pin, edge.level)):
+                    raise RuntimeError(f"{edge.name} was not driven")
+                timestamp = records[(edge.pin, edge.level)].pop(0)
+                samples.setdefault(edge.name, []).append(timestamp - (t0 + edge.offset))
+                actual[edge.name] = timestamp
+            interval = actual['plunger release'] - actual['spray on']
+            samples.setdefault('spray to plunge', []).append(interval - SIOsequencer.ns(pdelay - sdelay))
+    finally:
+        engine.fire = fire
+    return samples, cpu
+
+def printtable(results, cpu):
+    print(f"  {'':<17} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+    for name, stats in results.items():
+        print(f"  {name:<17} {stats['p50']:9.1f} {stats['p99']:9.1f} {stats['max']:9.1f}")
+    print(f"  CPU use: {100 * sum(cpu) / len(cpu):.1f}% of one core")
+
+def printcomparison(normal, realtime):
+    print(f"  {'':<17} {'p99 us':>9} {'p99 rt':>9} {'max us':>9} {'max rt':>9}")
+    for name, stats in normal.items():
+        rt = realtime[name]
+        print(f"  {name:<17} {stats['p99']:9.1f} {rt['p99']:9.1f} {stats['max']:9.1f} {rt['max']:9.1f}")
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIObench')
+    parser.add_argument('--runs',       help='Runs per parameter set',default = 50, type=int,required=False)
+    parser.add_argument('--stime',      help='Spray times to test (seconds)',nargs='+',default = [0.002, 0.005, 0.02], type=float)
+    parser.add_argument('--sdelay',     help='Spray delays to test (seconds)',nargs='+',default = [0, 0.001], type=float)
+    parser.add_argument('--pdelay',     help='Plunge delays to test (seconds)',nargs='+',default = [0.05], type=float)
+    parser.add_argument('--kuhnketime', help='Plunger hold time per run (seconds)',default = 0.01, type=float,required=False)
+    parser.add_argument('--waves',      help='Time the edges with the wave backend',action = 'store_true')
+    parser.add_argument('--realtime',   help='Also run every set in SIOrealtime mode and compare',action = 'store_true')
+    parser.add_argument('--json',       help='Write the results to this file',required=False)
+    parser.add_argument('--limit',      help='Fail if any p99 edge error exceeds this (us)',type=float,required=False)
+    args = parser.parse_args()
+
+    modes = [False, True] if args.realtime else [False]
+    allsamples, allcpu, cases = {mode: {} for mode in modes}, {mode: [] for mode in modes}, []
+    for stime, sdelay, pdelay in itertools.product(args.stime, args.sdelay, args.pdelay):
+        for realtime in modes:
+            result = runcase(stime, sdelay, pdelay, args.runs, args.kuhnketime, args.waves, realtime)
+            print(f"stime={stime} sdelay={sdelay} pdelay={pdelay} ({args.runs} runs{', realtime' if realtime else ''})")
+            if result is None:
+                print("  refused by the sequence, skipped")
+                break
+            samples, cpu = result
+            stats = {name: summary(values) for name, values in samples.items()}
+            printtable(stats, cpu)
+            cases.append({'stime': stime, 'sdelay': sdelay, 'pdelay': pdelay, 'runs': args.runs,
+                          'realtime': realtime, 'cpu': sum(cpu) / len(cpu), 'edges': stats})
+            for name, values in samples.items():
+                allsamples[realtime].setdefault(name, []).extend(values)
+            allcpu[realtime].extend(cpu)
+
+    if not cases:
+        print("No parameter set could be run")
+        sys.exit(1)
+    totals = {}
+    for realtime in modes:
+        totals[realtime] = {name: summary(values) for name, values in allsamples[realtime].items()}
+        print(f"All runs ({len(allcpu[realtime])}{', realtime' if realtime else ''}):")
+        printtable(totals[realtime], allcpu[realtime])
+    if args.realtime:
+        print("Without / with realtime mode:")
+        printcomparison(totals[False], totals[True])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cases': cases,
+                       'total': totals[False], 'cpu': sum(allcpu[False]) / len(allcpu[False]),
+                       **({'realtime': totals[True], 'realtime cpu': sum(allcpu[True]) / len(allcpu[True])}
+                          if args.realtime else {})}, f, indent=2)
+
+    if args.limit is not None:
+        worst = max(stats['p99'] for total in totals.values() for name, stats in total.items() if name != 'start skew')
+        if worst > args.limit:
+            print(f"FAIL: p99 edge error {worst:.1f} us exceeds {args.limit} us")
+            sys.exit(1)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# actuator latency calibration, the automated version of
+# calibrate_speed_sensor.py: fires the plunger repeatedly with the cannon
+# reversed and times the IR sensor edges from their timestamps. The sensor sits
+# at the bottom of the stroke, so the plunger leaves it as soon as it starts
+# back up: the time from the release command to that falling edge is the
+# solenoid dead time, the plunger's latency (the energising and releasing dead
+# times are taken to be alike). Command to immersion, dead time plus travel, is
+# stored alongside for reference. The distribution is stored in a per-device
+# profile; the spray latency (command to visible spray) comes from SIOtimeline
+# and is added with --spray. When a profile exists SIOsequencer.plan() moves
+# every edge earlier by the latency of its actuator, so spray and plunger
+# start moving at the requested sdelay and pdelay.
+#
+# The profile is SIOprofile.json next to these scripts, or the file named by
+# SIO_PROFILE; shots and calibration (in process or on SIOdaemon) all use it.
+#
+# profile (JSON), latencies in seconds
+#   {"device": "sio-1", "calibrated": "2026-10-18 14:02:11",
+#    "actuators": {"plunger": {"pin": 13, "latency": 0.0121, "immersion": 0.0512, "runs": 20, ...},
+#                  "cannon":  {"pin": 16, "latency": 0.0004, "source": "SIOtimeline"}}}
+
+import os, time, json, socket, statistics
+import argparse
+from datetime import datetime
+import SIOpinlist as pin
+
+PROFILE = os.path.abspath(os.environ.get('SIO_PROFILE',
+                                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SIOprofile.json')))
+MAXSPRAY = 0.1  # s, a longer spray latency is a misreading of the SIOtimeline recording
+
+def load(path=PROFILE):
+    """The profile, None if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save(profile, path=PROFILE):
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+cache = {}
+
+def latencies(path=PROFILE):
+    """((pin, ns), ...) of the calibrated actuators, () without a profile;
+    hashable for SIOsequencer.plan(), reread only when the file changes
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return ()
+    if path not in cache or cache[path][0] != mtime:
+        profile = load(path) or {}
+        found = tuple(sorted((int(actuator['pin']), round(actuator['latency'] * 1e9))
+                             for actuator in profile.get('actuators', {}).values()))
+        cache[path] = (mtime, found)
+    return cache[path][1]
+
+def summary(values):
+    """Distribution of latencies in s"""
+    values = sorted(values)
+    def percentile(q):
+        return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+    return {'latency': statistics.median(values),
+            'mean': statistics.mean(values),
+            'std': statistics.pstdev(values),
+            'min': values[0], 'p5': percentile(0.05), 'p95': percentile(0.95), 'max': values[-1]}
+
+def measure(runs=20, gap=2, hold=0.5):
+    """Fire the plunger `runs` times on configured pins, holding it down for
+    `hold` s and leaving it `gap` s to come back up; returns the release
+    command to IR falling edge (dead time) and fire command to IR rising edge
+    (immersion) latencies in s and the number of shots the sensor missed,
+    None if the interlock failed or it was aborted
+    """
+    from SIOgpio import GPIO
+    import SIOedges, SIOsequencer, SIOapplyandplunge
+    since = SIOapplyandplunge.aborts
+    # the cannon must be out of the plunger's way
+    GPIO.output(pin.cannon, GPIO.LOW)
+    GPIO.output(pin.cannonposition, GPIO.LOW)
+    # an empty shot: powers the IR sensor, checks the interlock and watches it
+    # until disarmed, and SIOapplyandplunge.abort() cancels it
+    shot = SIOapplyandplunge.armplan(SIOsequencer.Plan((), hold), since=since)
+    if shot is None:
+        return None
+    cancel = shot.cancel
+    found, immersions, missed = [], [], 0
+    try:
+        for run in range(runs):
+            if GPIO.input(pin.interlock)==1:
+                print("Interlock fail: cryogen container is not in place")
+                cancel.abort(GPIO.output)
+                break
+            down = SIOedges.ImmersionTimer(pin.irsensor)
+            up = SIOedges.ImmersionTimer(pin.irsensor, level=0)
+            with cancel.lock:
+                if cancel.is_set():
+                    down.result()
+                    up.result()
+                    break
+                t0 = time.monotonic_ns()
+                down.start(t0)
+                GPIO.output(pin.plunger, GPIO.HIGH)
+            SIOsequencer.waituntil(t0 + SIOsequencer.ns(hold), cancel.event)
+            released = time.monotonic_ns()
+            up.start(released)
+            GPIO.output(pin.plunger, GPIO.LOW)
+            # plunger back up, solenoid cooled down
+            SIOsequencer.waituntil(released + SIOsequencer.ns(gap), cancel.event)
+            # the edges carry their own timestamps, they only have to be read
+            immersion, deadtime = down.result(), up.result()
+            if cancel.is_set():
+                break
+            if immersion is None:
+                missed += 1
+                print(f"  run {run + 1}: no IR edge within {hold} s")
+            elif deadtime is None:
+                missed += 1
+                print(f"  run {run + 1}: the plunger did not leave the IR sensor within {gap} s")
+            else:
+                found.append(deadtime)
+                immersions.append(immersion)
+                print(f"  run {run + 1}: dead time {deadtime * 1e3:.2f} ms, immersion {immersion * 1e3:.2f} ms")
+    finally:
+        GPIO.output(pin.plunger, GPIO.LOW)
+        GPIO.output(pin.sensorpower, GPIO.LOW)
+        shot.disarm()
+    if cancel.is_set():
+        if shot.watchdog.opened is not None:
+            print("Interlock fail: cryogen container moved during the calibration")
+        print(f"Calibration aborted after {len(found) + missed} of {runs} shots")
+        return None
+    return found, immersions, missed
+
+def calibrate(runs=20, gap=2, hold=0.5, path=PROFILE, device=None):
+    """Measure the plunger and store it in the profile, returns the profile
+    or None if the sensor never fired
+    """
+    print(f"Firing the plunger {runs} times, {gap} s apart")
+    measured = measure(runs, gap, hold)
+    if measured is None:
+        print("Nothing stored")
+        return None
+    found, immersions, missed = measured
+    if not found:
+        print("The IR sensor did not see the plunger, nothing stored")
+        return None
+    profile = load(path) or {'actuators': {}}
+    profile['device'] = device or profile.get('device') or socket.gethostname()
+    profile['calibrated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    profile['actuators']['plunger'] = {'pin': pin.plunger, 'runs': len(found), 'missed': missed, **summary(found),
+                                       'immersion': statistics.median(immersions)}
+    save(profile, path)
+    show(profile)
+    return profile
+
+def show(profile):
+    print(f"Latency profile of {profile.get('device')} ({profile.get('calibrated')}):")
+    for name, actuator in profile.get('actuators', {}).items():
+        spread = ''
+        if 'p5' in actuator:
+            spread = (f" (p5 {actuator['p5'] * 1e3:.2f}, p95 {actuator['p95'] * 1e3:.2f}, "
+                      f"std {actuator['std'] * 1e3:.2f} ms, {actuator['runs']} runs)")
+        if 'immersion' in actuator:
+            spread += f", immersion {actuator['immersion'] * 1e3:.2f} ms"
+        print(f"  {name:<8} pin {actuator['pin']:<3} {actuator['latency'] * 1e3:8.2f} ms{spread}")
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOcalibrate')
+    parser.add_argument('--runs',    help='Plunger shots to measure',default = 20, type=int,required=False)
+    parser.add_argument('--gap',     help='Time between shots (seconds)',default = 2, type=float,required=False)
+    parser.add_argument('--hold',    help='Plunger hold per shot, the IR edge must come within it (seconds)',default = 0.5, type=float,required=False)
+    parser.add_argument('--device',  help='Name stored in the profile (default: host name)',required=False)
+    parser.add_argument('--spray',   help='Store this spray latency (seconds, from SIOtimeline) instead of measuring',type=float,required=False)
+    parser.add_argument('--show',    help='Only show the profile',action = 'store_true')
+    parser.add_argument('--clear',   help='Remove the profile, shots run uncompensated',action = 'store_true')
+    args = parser.parse_args()
+
+    if args.clear:
+        if os.path.exists(PROFILE):
+            os.unlink(PROFILE)
+        exit(0)
+    if args.spray is not None and not 0 <= args.spray <= MAXSPRAY:
+        print(f"Spray latency must be between 0 and {MAXSPRAY} s")
+        exit(1)
+    if args.show or args.spray is not None:
+        profile = load()
+        if args.spray is not None:
+            profile = profile or {'device': args.device or socket.gethostname(), 'actuators': {}}
+            profile['actuators']['cannon'] = {'pin': pin.cannon, 'latency': args.spray, 'source': 'SIOtimeline'}
+            save(profile)
+        if profile is None:
+            print("No profile in", PROFILE)
+            exit(1)
+        show(profile)
+        exit(0)
+
+    import SIOclient
+    if SIOclient.available():
+        reply = SIOclient.run('calibrate', runs=args.runs, gap=args.gap, hold=args.hold, device=args.device)
+        exit(0 if reply.get('done') else 1)
+
+    import SIOapplyandplunge, SIOedges
+    from SIOgpio import GPIO
+    SIOapplyandplunge.setuppins()
+    ok = calibrate(args.runs, args.gap, args.hold, device=args.device)
+    SIOedges.stopall()
+    GPIO.cleanup()
+    exit(0 if ok else 1)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# the camera pipeline in a process of its own, away from the GIL of the GPIO
+# sequencer: a capture process runs Camera + FrameThread and publishes every
+# frame into a multiprocessing.shared_memory ring. There is one writer and no
+# lock: a frame is copied into its slot, the slot is stamped with the frame
+# index and then the ring count is advanced. Readers in any process take
+# zero-copy views of a slot and check afterwards that it still carries the
+# index they read (a seqlock), the ring is big enough that this rarely fails.
+#
+# Run it directly to serve the camera under a fixed name, e.g.
+#   SIOcamproc.py --name SIOframes --slots 600
+# and attach with reader('SIOframes') from the GUI, SIOcapture or analysis.
+# The capture process owns the block: it creates it and unlinks it when it
+# stops, everyone else only opens and closes it.
+
+import sys, time, threading
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import argparse
+import numpy
+
+HEADER = 8      # int64: count, slots, height, width, channels, color mode, spare, spare
+
+def attach(name, child=False):
+    """Open an existing block without making this process its owner; child is
+    for a process that shares the resource tracker of the capture process
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # before 3.13 opening registers the block too, and it would be unlinked
+    # when this process exits. A parent of the capture process shares its
+    # tracker, where the creator's one registration has to stay so the block
+    # is removed should the capture process die
+    block = shared_memory.SharedMemory(name=name)
+    if not child:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+class SharedRing:
+    """Frames, capture timestamps and frame numbers of the last `slots` frames"""
+    def __init__(self, block):
+        self.block = block
+        header = numpy.ndarray(HEADER, numpy.int64, buffer=block.buf)
+        slots, height, width, channels = (int(n) for n in header[1:5])
+        self.header = header
+        self.slots = slots
+        self.color_mode = int(header[5])
+        offset = HEADER * 8
+        self.sequence, self.stamps, self.numbers = (
+            numpy.ndarray(slots, numpy.int64, buffer=block.buf, offset=offset + i * slots * 8) for i in range(3))
+        offset += 3 * slots * 8
+        shape = (slots, height, width, channels)
+        self.frames = numpy.ndarray(shape, numpy.uint8, buffer=block.buf, offset=offset)
+
+    @staticmethod
+    def size(slots, shape):
+        return (HEADER + 3 * slots) * 8 + slots * int(numpy.prod(shape))
+
+    @classmethod
+    def create(cls, name, slots, shape, color_mode):
+        shape = tuple(shape) + (1,) * (3 - len(shape))
+        block = shared_memory.SharedMemory(name=name, create=True, size=cls.size(slots, shape))
+        header = numpy.ndarray(HEADER, numpy.int64, buffer=block.buf)
+        header[:] = [0, slots, shape[0], shape[1], shape[2], color_mode, 0, 0]
+        ring = cls(block)
+        ring.sequence[:] = -1
+        return ring
+
+    def count(self):
+        """Frames written so far, the newest has index count() - 1"""
+        return int(self.header[0])
+
+    def write(self, image, stamp, number):
+        """Single writer: fill the next slot, then publish it"""
+        index = int(self.header[0])
+        slot = index % self.slots
+        self.sequence[slot] = -1                # readers see the slot as being written
+        self.frames[slot].reshape(image.shape)[:] = image
+        self.stamps[slot] = stamp
+        self.numbers[slot] = -1 if number is None else number
+        self.sequence[slot] = index
+        self.header[0] = index + 1
+
+    def read(self, index):
+        """(frame view, timestamp, frame number) of a frame, None if it is gone;
+        check valid(index) after using the view
+        """
+        slot = index % self.slots
+        if self.sequence[slot] != index:
+            return None
+        frame = self.frames[slot]
+        if frame.shape[2] == 1:
+            frame = frame[:, :, 0]
+        result = frame, int(self.stamps[slot]), int(self.numbers[slot])
+        return result if self.valid(index) else None
+
+    def valid(self, index):
+        return self.sequence[index % self.slots] == index
+
+    def close(self):
+        del self.header, self.sequence, self.stamps, self.numbers, self.frames
+        self.block.close()
+
+def reader(name):
+    """SharedRing served by another process"""
+    return SharedRing(attach(name))
+
+class RingWriter:
+    """FrameThread view of the capture process: frame into the ring, buffer back to the camera"""
+    def __init__(self, ring):
+        self.ring = ring
+
+    def handle(self, image_data):
+        self.ring.write(image_data.as_1d_image(), image_data.timestamp, image_data.frame)
+        image_data.unlock()
+
+class RingFrame:
+    """What a FrameThread view uses of ImageData, for a frame in the ring: the
+    image is a view of its slot, which the writer may overwrite at any time
+    """
+    def __init__(self, ring, index, image, timestamp, frame):
+        self.ring = ring
+        self.index = index
+        self.image = image
+        self.color_mode = ring.color_mode
+        self.timestamp = timestamp
+        self.frame = frame
+
+    def as_1d_image(self):
+        return self.image
+
+    def valid(self):
+        """False once the slot was overwritten, check it after using the image"""
+        return self.ring.valid(self.index)
+
+    def copy(self):
+        """The frame as an array of its own, check valid() after copying"""
+        return numpy.array(self.image)
+
+    def unlock(self):
+        pass
+
+class RingFeed(threading.Thread):
+    """Feeds the newest frames of a ring to FrameThread views in this process
+    without copying them; a view checks valid() after using a frame and copies
+    what it keeps. A view that falls behind skips to the newest frame
+    """
+    def __init__(self, ring, views, poll=0.001):
+        super().__init__(daemon=True)
+        self.ring = ring
+        self.views = views if type(views) is list else [views]
+        self.poll = poll
+        self.running = True
+
+    def run(self):
+        seen = self.ring.count()
+        while self.running:
+            count = self.ring.count()
+            if count == seen:
+                time.sleep(self.poll)
+                continue
+            seen = count
+            frame = self.ring.read(count - 1)
+            if frame is None:
+                continue
+            image, stamp, number = frame
+            image_data = RingFrame(self.ring, count - 1, image, stamp, None if number < 0 else number)
+            for view in self.views:
+                view.handle(image_data)
+
+    def stop(self):
+        self.running = False
+
+def clip(ring, trigger, pre, post, timeout=5):
+    """Copies of the `pre` frames before and `post` frames from the monotonic ns
+    trigger on, waiting for the post frames; (frames, timestamps) oldest first
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        count = ring.count()
+        indices = range(max(0, count - ring.slots + 1), count)
+        after = [index for index in indices if ring.valid(index) and ring.stamps[index % ring.slots] >= trigger]
+        if len(after) >= post:
+            first = after[0]
+            wanted = range(max(0, first - pre), after[post - 1] + 1)
+            slots = [index % ring.slots for index in wanted]
+            frames, stamps = ring.frames[slots], ring.stamps[slots].copy()
+            if all(ring.valid(index) for index in wanted):
+                return (frames[:, :, :, 0] if frames.shape[3] == 1 else frames), stamps
+        time.sleep(0.01)
+    raise TimeoutError(f"the ring did not get {post} frames after the trigger")
+
+def serve(name, slots, source, buffers, fps, colormode, ready, stop):
+    """Capture process: camera into the ring until stop is set"""
+    from pyueye_example_utils import FrameThread
+    if source == 'ueye':
+        from pyueye import ueye
+        from pyueye_example_camera import Camera
+        cam = Camera()
+        cam.init()
+        cam.set_colormode(ueye.IS_CM_MONO8 if colormode == 'mono8' else ueye.IS_CM_BGR8_PACKED)
+    else:
+        import SIOreplay
+        frames = SIOreplay.synthetic() if source == 'synthetic' else SIOreplay.load(source)
+        cam = SIOreplay.ReplayCamera(frames, fps, colormode)
+        cam.init()
+    cam.alloc(buffers)
+    ring = SharedRing.create(name, slots, cam.img_buffers[0].image.shape, cam.get_colormode())
+    thread = FrameThread(cam, RingWriter(ring))
+    cam.capture_video()
+    thread.start()
+    ready.set()
+    try:
+        stop.wait()
+    finally:
+        thread.stop()
+        thread.join()
+        cam.exit()
+        ring.close()
+        ring.block.unlink()
+
+def start(name='SIOframes', slots=600, source='ueye', buffers=10, fps=200, colormode='mono8'):
+    """Start the capture process, returns (process, stop event, SharedRing)"""
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Event(), context.Event()
+    process = context.Process(target=serve, args=(name, slots, source, buffers, fps, colormode, ready, stop),
+                              daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("capture process did not start")
+    return process, stop, SharedRing(attach(name, child=True))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOcamproc')
+    parser.add_argument('--name',      help='Name of the shared memory ring',default = 'SIOframes', required=False)
+    parser.add_argument('--slots',     help='Frames kept in the ring',default = 600, type=int,required=False)
+    parser.add_argument('--source',    help='ueye, synthetic or a clip to replay',default = 'ueye', required=False)
+    parser.add_argument('--buffers',   help='Camera sequence buffers',default = 10, type=int,required=False)
+    parser.add_argument('--fps',       help='Frame rate of a replayed source',default = 200, type=float,required=False)
+    parser.add_argument('--colormode', help='mono8 or bgr8',default = 'mono8', required=False)
+    args = parser.parse_args()
+
+    process, stop, ring = start(args.name, args.slots, args.source, args.buffers, args.fps, args.colormode)
+    print(f"[SIOcamproc] serving {args.name}: {ring.slots} frames of {ring.frames.shape[1:]}, Ctrl-C to stop")
+    try:
+        while process.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print(f"[SIOcamproc] {ring.count()} frames captured")
+    ring.close()
+    stop.set()
+    process.join()
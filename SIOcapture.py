@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# high-speed video of the spray hitting the grid: every camera frame is copied
+# into a preallocated, memory-mapped ring of the last N frames. When the
+# sequencer drives the spray edge the ring is triggered, it keeps recording
+# until `post` frames after the trigger and then freezes; the `pre` frames
+# before and `post` frames after are written to disk in one go once the shot is
+# done, nothing touches the disk while it runs.
+#
+# The shot runs in this process (like SIOcontrol), so stop SIOdaemon first;
+# or serve the camera from SIOcamproc and pass --camproc, then the camera
+# stays out of the sequencer's process and the clip is cut from its ring.
+
+import os, time, threading, tempfile
+import argparse
+import numpy
+import SIOpinlist as pin
+from SIOmetrics import metrics
+
+# RAM-backed by default, the ring must not page out to disk during a shot
+RINGDIR = os.environ.get('SIO_RINGDIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+class FrameRing:
+    """FrameThread view: keeps the last `frames` frames and freezes `post`
+    frames after trigger(), with at least `pre` frames before it still held
+    """
+    def __init__(self, shape, frames=300, pre=100, post=100, directory=RINGDIR):
+        if pre + post > frames:
+            raise ValueError(f"a ring of {frames} frames cannot hold {pre} + {post} frames")
+        self.pre, self.post = pre, post
+        self.file = tempfile.NamedTemporaryFile(prefix='SIOring', dir=directory)
+        self.ring = numpy.memmap(self.file, numpy.uint8, 'w+', shape=(frames,) + tuple(shape))
+        self.ring[:] = 0    # touch every page now rather than during the shot
+        self.stamps = numpy.zeros(frames, numpy.int64)
+        self.count = 0      # frames written since reset
+        self.triggered = None
+        self.index = None   # count of the first frame at or after the trigger
+        self.frozen = threading.Event()
+
+    def reset(self):
+        self.count = 0
+        self.triggered = self.index = None
+        self.frozen.clear()
+
+    def trigger(self, timestamp=None):
+        """Mark the event, monotonic ns; only the first trigger counts"""
+        if self.triggered is None:
+            self.triggered = time.monotonic_ns() if timestamp is None else timestamp
+
+    def handle(self, image_data):
+        if not self.frozen.is_set():
+            stamp = getattr(image_data, 'timestamp', None) or time.monotonic_ns()
+            slot = self.count % len(self.ring)
+            self.ring[slot] = image_data.as_1d_image()   # the only copy of the frame
+            if not image_data.valid():
+                # overwritten in a SIOcamproc ring while it was copied
+                metrics.count('recorder torn')
+                image_data.unlock()
+                return
+            self.stamps[slot] = stamp
+            if self.index is None and self.triggered is not None and stamp >= self.triggered:
+                self.index = self.count
+            self.count += 1
+            metrics.count('recorded')
+            if self.index is not None and self.count - self.index >= self.post:
+                self.frozen.set()
+        image_data.unlock()
+
+    def clip(self):
+        """Frames and timestamps from `pre` before to `post` after the trigger, oldest first"""
+        end = self.count if self.index is None else min(self.count, self.index + self.post)
+        start = max(0, end - len(self.ring),
+                    end - self.post - self.pre if self.index is None else self.index - self.pre)
+        slots = numpy.arange(start, end) % len(self.ring)
+        return self.ring[slots], self.stamps[slots]
+
+    def save(self, path, **extra):
+        """Write the clip as one .npz: frames, timestamps (monotonic ns) and trigger"""
+        frames, stamps = self.clip()
+        numpy.savez(path, frames=frames, timestamps=stamps,
+                    trigger=-1 if self.triggered is None else self.triggered, **extra)
+        return len(frames)
+
+    def close(self):
+        del self.ring
+        self.file.close()
+
+def triggering(ring, output, channel=pin.cannon):
+    """output(pin, level) for SIOapplyandplunge.fire that triggers the ring on the spray edge"""
+    def drive(p, level):
+        output(p, level)
+        if p == channel and level:
+            ring.trigger(time.monotonic_ns())
+    return drive
+
+def shotfields(result):
+    """What SIOtimeline needs of a SIOapplyandplunge.fire() result, for the clip"""
+    return {'t0': result['t0'],
+            'immersion': numpy.nan if result['immersion'] is None else result['immersion'],
+            'edge_names': [name for name, scheduled, actual in result['edges']],
+            'edge_times': [result['t0'] + round(actual * 1e9) for name, scheduled, actual in result['edges']]}
+
+def sprayedge(result):
+    """Monotonic ns of the first spray edge ('... on') of a shot"""
+    fields = shotfields(result)
+    return next(t for name, t in zip(fields['edge_names'], fields['edge_times']) if name.endswith(' on'))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOcapture')
+    parser.add_argument('--stime',      help='Duration of sample application (seconds)',type=float,required=True)
+    parser.add_argument('--sdelay',     help='Time to wait before applying (seconds)',default = 0, type=float,required=False)
+    parser.add_argument('--pdelay',     help='Time to wait before plunging (seconds)',default = 0, type=float,required=False)
+    parser.add_argument('--donotplunge',help='Do not fire the plunger (diagnostic)',action = 'store_true')
+    parser.add_argument('--frames',     help='Frames kept in the ring',default = 300, type=int,required=False)
+    parser.add_argument('--pre',        help='Frames saved before the spray edge',default = 100, type=int,required=False)
+    parser.add_argument('--post',       help='Frames saved from the spray edge on',default = 100, type=int,required=False)
+    parser.add_argument('--buffers',    help='Camera sequence buffers',default = 10, type=int,required=False)
+    parser.add_argument('--camproc',    help='Read the frames from this SIOcamproc ring instead of opening the camera',default = None, required=False)
+    parser.add_argument('--out',        help='Clip file (.npz)',default = time.strftime('SIOcapture_%Y%m%d_%H%M%S.npz'), required=False)
+    args = parser.parse_args()
+
+    if args.camproc:
+        # the camera runs in SIOcamproc, this process only fires the shot (or
+        # lets SIOdaemon fire it) and cuts the clip out of the shared ring
+        import SIOcamproc, SIOclient
+        ring = SIOcamproc.reader(args.camproc)
+        shot = {'stime': args.stime, 'sdelay': args.sdelay, 'pdelay': args.pdelay, 'donotplunge': args.donotplunge}
+        if SIOclient.available():
+            result = SIOclient.run('applyandplunge', **shot).get('result')
+        else:
+            import SIOapplyandplunge, SIOedges
+            from SIOgpio import GPIO
+            SIOapplyandplunge.setuppins()
+            result = SIOapplyandplunge.applyandplunge(**shot)
+            SIOedges.stopall()
+            GPIO.cleanup()
+        if result:
+            spray = sprayedge(result)
+            frames, stamps = SIOcamproc.clip(ring, spray, args.pre, args.post)
+            numpy.savez(args.out, frames=frames, timestamps=stamps, trigger=spray, **shotfields(result))
+            print(f"[SIOcapture] {len(frames)} frames written to {args.out}")
+        ring.close()
+        exit(0 if result else 1)
+
+    import SIOclient
+    if SIOclient.available():
+        # the daemon owns the pins, it has to fire the shot
+        print("[SIOcapture] SIOdaemon is running, serve the camera with SIOcamproc and use --camproc")
+        exit(1)
+
+    import SIOapplyandplunge, SIOedges
+    from SIOgpio import GPIO
+    from pyueye import ueye
+    from pyueye_example_camera import Camera
+    from pyueye_example_utils import FrameThread
+
+    cam = Camera()
+    cam.init()
+    cam.set_colormode(ueye.IS_CM_MONO8)
+    cam.alloc(args.buffers)
+    ring = FrameRing(cam.img_buffers[0].image.shape, args.frames, args.pre, args.post)
+    thread = FrameThread(cam, ring)
+    cam.capture_video()
+    thread.start()
+
+    SIOapplyandplunge.setuppins()
+    shot = SIOapplyandplunge.arm(args.stime, args.sdelay, args.pdelay, args.donotplunge)
+    result = shot is not None and SIOapplyandplunge.fire(shot, output=triggering(ring, GPIO.output))
+    if result and not ring.frozen.wait(5):
+        print("[SIOcapture] Camera did not deliver the frames after the spray edge")
+
+    thread.stop()
+    thread.join()
+    cam.exit()
+    SIOedges.stopall()
+    GPIO.cleanup()
+    if result:
+        saved = ring.save(args.out, **shotfields(result))
+        print(f"[SIOcapture] {saved} frames written to {args.out}")
+    print("\n".join(metrics.report()))
+    ring.close()
+    exit(0 if result else 1)
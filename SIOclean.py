@@ -1,27 +1,36 @@
 #!/usr/bin/env python3
-import RPi.GPIO as GPIO
-#import Mock.GPIO as GPIO
+from SIOgpio import GPIO
 import time, argparse
 import SIOpinlist as pin
+import SIOclient
+
+def clean(stime=0.2, cycles=5):
+    print(f"[SIOclean] Starting cleaning: {cycles} cycles, {stime}s pulse")
+
+    for x in range(cycles):
+        GPIO.output(pin.cannon,GPIO.HIGH)
+        time.sleep(stime)
+        GPIO.output(pin.cannon,GPIO.LOW)
+        time.sleep(0.2)
+
+    print("[SIOclean] Cleaning completed")
+    return True
 
 if __name__=='__main__':
 
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setup(pin.cannon,GPIO.OUT)
-    
     parser = argparse.ArgumentParser(description='Arguments for cleanprocess')
     parser.add_argument('--stime', help='Duration of cleaning pulse (seconds)', default = 0.2, type=float,required=False)
     parser.add_argument('--cycles', help='number of cleaning pulses',default = 5, type=int,required=False)
     args = parser.parse_args()
 
-    print(f"[SIOclean] Starting cleaning: {args.cycles} cycles, {args.stime}s pulse")
-    
-    for x in range(args.cycles):
-        GPIO.output(pin.cannon,GPIO.HIGH)
-        time.sleep(args.stime)
-        GPIO.output(pin.cannon,GPIO.LOW)
-        time.sleep(0.2)
-    
-    print("[SIOclean] Cleaning completed")
+    # hand over to SIOdaemon if it is running, it keeps the pins configured
+    if SIOclient.available():
+        reply = SIOclient.run('clean', stime=args.stime, cycles=args.cycles)
+        exit(0 if reply.get('done') else 1)
+
+    GPIO.setwarnings(False)
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(pin.cannon,GPIO.OUT)
+
+    clean(args.stime, args.cycles)
     GPIO.cleanup()
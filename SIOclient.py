@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# thin client for SIOdaemon: sends one command per connection and streams back
+# the output of the command as it runs. Control keeps a connection open for
+# commands that cannot wait for a connect, such as abort.
+
+import os, socket, json
+
+SOCKET = os.environ.get('SIO_SOCKET', '/tmp/SIOdaemon.sock')
+
+def available(path=SOCKET):
+    """True if a daemon is listening on the socket"""
+    if not os.path.exists(path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+    except OSError:
+        return False
+    return True
+
+def request(cmd, path=SOCKET, **params):
+    """Send a command to the daemon and yield its replies as dicts
+    {'line': text} for output, the last reply is {'done': ok, 'result': ...}
+    or {'error': text}
+    """
+    params['cmd'] = cmd
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall((json.dumps(params) + '\n').encode())
+        with s.makefile('r') as replies:
+            for reply in replies:
+                yield json.loads(reply)
+
+def run(cmd, path=SOCKET, **params):
+    """Send a command, print its output and return the final reply"""
+    final = {'error': 'no reply from daemon'}
+    for reply in request(cmd, path, **params):
+        if 'line' in reply:
+            print(reply['line'], flush=True)
+        else:
+            final = reply
+    if 'error' in final:
+        print("[SIOdaemon]", final['error'], flush=True)
+    return final
+
+class Control:
+    """Pre-opened connection to the daemon for urgent commands"""
+    def __init__(self, path=SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.socket.sendall(b'{"cmd": "control"}\n')
+        self.replies = self.socket.makefile('r')
+
+    def send(self, cmd, **params):
+        """Send a command and return its reply"""
+        params['cmd'] = cmd
+        self.socket.sendall((json.dumps(params) + '\n').encode())
+        reply = self.replies.readline()
+        if not reply:
+            raise ConnectionError('daemon closed the control connection')
+        return json.loads(reply)
+
+    def abort(self):
+        """Cancel the running or armed shot and drive the actuators safe"""
+        return self.send('abort')
+
+    def close(self):
+        self.replies.close()
+        self.socket.close()
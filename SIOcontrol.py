@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 
-# Uncomment for use of pi
-import RPi.GPIO as GPIO
-#import Mock.GPIO as GPIO
+from SIOgpio import GPIO
 #import Adafruit_DHT
-import time, threading
+import time
 import argparse
-import sys, select
+import SIOsequencer
+import SIOedges
 
 def cannonforward(pin_cannonposition):
     print("Advancing the cannon")
@@ -24,17 +23,12 @@ def cannonreverse(pin_cannonposition,cannonreversedelay):
     print("reversing the cannon")
     GPIO.output(pin_cannonposition,GPIO.LOW)
 
-def timeprocess(pin_irsensor,exittime):
-    tic = time.time()
-    print('***',exittime)
-    
-    while GPIO.input(pin_irsensor)==0 and time.time()-tic<exittime:
-        pass
-    toc=time.time()
-
-    #print GPIO.input(pin_irsensor)
-    total = toc - tic
-    print("Time from start to immersion:", total)
+def timeprocess(immersion,exittime):
+    total = immersion.result()
+    if total is None:
+        print("No immersion detected within", exittime, "s")
+    else:
+        print("Time from start to immersion:", total)
 
         
 def applysample(pin_cannon,wait,duration):
@@ -50,9 +44,9 @@ def releaseplunger(pin_plunger,wait):
 def resetplunger(pin_plunger):
     GPIO.output(pin_plunger,GPIO.LOW)
     
-def readenvironment(pin_dht22):
-    humidity, temperature = Adafruit_DHT.read_retry(22, pin=pin_dht22)
-    return humidity, temperature
+#def readenvironment(pin_dht22):
+#    humidity, temperature = Adafruit_DHT.read_retry(22, pin=pin_dht22)
+#    return humidity, temperature
     
 if __name__=='__main__':
     parser = argparse.ArgumentParser(description='Arguments for SIOcontrol')
@@ -123,23 +117,17 @@ if __name__=='__main__':
     
     input("Press Enter to continue...")
 
-    # set up processes
-    sample = threading.Thread(target=applysample, args=(pin_cannon,args.sdelay,args.stime))  
-    plunger = threading.Thread(target=releaseplunger, args=(pin_plunger,args.pdelay))  
-    cannonposition = threading.Thread(target=cannonreverse, args=(pin_cannonposition,cannonreversedelay))
-    clockit = threading.Thread(target=timeprocess, args=(pin_irsensor,exittime))
-    
-    # start processes
-    if not args.donotplunge:
-        plunger.start()
-        
-    sample.start()  
-    cannonposition.start()
-    clockit.start()
-    
-    # Kuhnke plunger
-    time.sleep(kuhnketime+args.pdelay+args.sdelay)
-    resetplunger(pin_plunger)
-    powerdownsensors(pin_sensorpower)
+    # every edge of the cycle gets an absolute deadline from one t0
+    edges = SIOsequencer.sprayandplunge(args.stime, args.sdelay, args.pdelay, args.donotplunge, kuhnketime,
+                                        cannon=pin_cannon, plunger=pin_plunger,
+                                        cannonposition=pin_cannonposition, sensorpower=pin_sensorpower)
+    immersion = SIOedges.ImmersionTimer(pin_irsensor)
+
+    t0 = time.monotonic_ns()
+    immersion.start(t0)
+    fired = SIOsequencer.fire(edges, GPIO.output, t0)
+    timeprocess(immersion, exittime)
+    SIOsequencer.report(fired, t0)
+    SIOedges.stopall()
     print("Done!")
     #print GPIO.input(pin_irsensor)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# long-lived hardware daemon: owns the GPIO pins from SIOpinlist, keeps them
+# configured between cycles and runs the commands sent by SIOclient over a
+# unix socket, so a button press no longer pays for interpreter start-up,
+# GPIO import/setup and cleanup
+
+from SIOgpio import GPIO
+import os, sys, time, json, signal, threading
+import argparse
+import socketserver
+from contextlib import redirect_stdout
+import SIOpinlist as pin
+import SIOclient
+import SIOedges
+import SIOapplyandplunge, SIOpowerupdown, SIOclean, SIOrecipe
+import SIOrealtime, SIOcalibrate
+
+# one command at a time drives the hardware
+hardware = threading.Lock()
+
+# shot waiting for 'fire', pins and sensors stay ready for it
+armed = None
+
+# fire every shot in SIOrealtime mode unless the client says otherwise
+realtime = False
+
+def arm(p):
+    global armed
+    disarm()
+    armed = SIOapplyandplunge.arm(p['stime'], p.get('sdelay', 0), p.get('pdelay', 0),
+                                  p.get('donotplunge', False), waves=p.get('waves', False),
+                                  realtime=p.get('realtime', realtime), feedforward=p.get('feedforward', True))
+    if armed is not None:
+        print("Armed")
+    return armed is not None
+
+def fire(p):
+    global armed
+    if armed is None:
+        print("Not armed")
+        return False
+    shot, armed = armed, None
+    return SIOapplyandplunge.fire(shot, p.get('received'))
+
+def disarm():
+    global armed
+    if armed is not None:
+        armed.disarm()
+        armed = None
+
+def abort(p):
+    """Cancel the shot being fired or armed and drive the actuators safe,
+    alongside whatever command holds the hardware
+    """
+    global armed
+    shot, armed = armed, None
+    if shot is not None:
+        shot.cancel.set()   # firing it later drives nothing
+    latency = SIOapplyandplunge.abort(p.get('received'))
+    # stdout may be redirected to the client of a running command
+    print(f"[SIOdaemon] abort: pins safe {latency / 1e3:.1f} us after the request", file=sys.__stdout__, flush=True)
+    if shot is not None:
+        shot.disarm()
+    return {'latency': latency / 1e9}
+
+# commands that must not wait for the hardware lock
+URGENT = {
+    'abort':          abort,
+}
+
+COMMANDS = {
+    'arm':            arm,
+    'fire':           fire,
+    'powerupdown':    lambda p: SIOpowerupdown.powerupdown(p['updown']),
+    'applyandplunge': lambda p: SIOapplyandplunge.applyandplunge(p['stime'], p.get('sdelay', 0),
+                                                                 p.get('pdelay', 0), p.get('donotplunge', False),
+                                                                 waves=p.get('waves', False),
+                                                                 realtime=p.get('realtime', realtime),
+                                                                 feedforward=p.get('feedforward', True)),
+    'clean':          lambda p: SIOclean.clean(p.get('stime', 0.2), int(p.get('cycles', 5))),
+    'recipe':         lambda p: SIOrecipe.run(p['recipe'], p.get('waves', False), p.get('realtime', realtime),
+                                              p.get('feedforward', True)),
+    'calibrate':      lambda p: SIOcalibrate.calibrate(int(p.get('runs', 20)), p.get('gap', 2), p.get('hold', 0.5),
+                                                       device=p.get('device')),
+}
+
+def watchstatus(out):
+    """Stream interlock and plunger IR sensor levels on every edge until the
+    client goes away; resent every few seconds so a lost client is noticed
+    """
+    changed = threading.Event()
+    def on_edge(level, timestamp):
+        changed.set()
+    watchers = [SIOedges.watcher(pin.interlock), SIOedges.watcher(pin.irsensor)]
+    for w in watchers:
+        w.subscribe(on_edge)
+    try:
+        while out.connected:
+            changed.clear()
+            out.send(status={'interlock': GPIO.input(pin.interlock),
+                             'irsensor': GPIO.input(pin.irsensor)})
+            changed.wait(5)
+    finally:
+        for w in watchers:
+            w.unsubscribe(on_edge)
+
+def control(out, requests):
+    """Pre-opened connection for URGENT commands: one request per line, each
+    answered when it is done, until the client goes away
+    """
+    for request in requests:
+        received = time.monotonic_ns()
+        try:
+            params = json.loads(request)
+            cmd = params.pop('cmd')
+        except (ValueError, KeyError, AttributeError):
+            out.send(error='malformed request')
+            continue
+        if cmd not in URGENT:
+            out.send(error='not a control command: ' + str(cmd))
+            continue
+        params['received'] = received
+        out.send(done=True, result=URGENT[cmd](params))
+
+# long-running streams, these do not take the hardware
+STREAMS = {
+    'status': watchstatus,
+}
+
+class LineWriter:
+    """File-like object that forwards printed lines to the client as they come"""
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buffer = ''
+        self.lock = threading.Lock()
+        self.connected = True
+
+    def send(self, **reply):
+        with self.lock:
+            if not self.connected:
+                return
+            try:
+                self.wfile.write((json.dumps(reply) + '\n').encode())
+                self.wfile.flush()
+            except OSError:
+                # client went away, the command still has to finish
+                self.connected = False
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        for line in lines:
+            self.send(line=line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        out = LineWriter(self.wfile)
+        request = self.rfile.readline()
+        received = time.monotonic_ns()
+        if not request:
+            return  # availability probe
+        try:
+            params = json.loads(request)
+            cmd = params.pop('cmd')
+        except (ValueError, KeyError, AttributeError):
+            out.send(error='malformed request')
+            return
+        if cmd in STREAMS:
+            STREAMS[cmd](out)
+            return
+        if cmd == 'control':
+            control(out, self.rfile)
+            return
+        if cmd in URGENT:
+            params['received'] = received
+            out.send(done=True, result=URGENT[cmd](params))
+            return
+        if cmd not in COMMANDS:
+            out.send(error='unknown command: ' + str(cmd))
+            return
+        if not hardware.acquire(blocking=False):
+            out.send(error='busy: another command is running')
+            return
+        try:
+            if cmd == 'fire':
+                params['received'] = received
+            else:
+                disarm()  # anything else changes the hardware under an armed shot
+            with redirect_stdout(out):
+                try:
+                    ok = COMMANDS[cmd](params)
+                except Exception as e:
+                    print(f"[SIOdaemon] {cmd} failed: {e!r}")
+                    ok = False
+                if out.buffer:
+                    out.write('\n')
+            if isinstance(ok, dict):
+                out.send(done=True, result=ok)
+            else:
+                out.send(done=bool(ok))
+        finally:
+            hardware.release()
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOdaemon')
+    parser.add_argument('--socket', help='Unix socket to listen on', default = SIOclient.SOCKET, required=False)
+    parser.add_argument('--realtime', help='Fire shots with SCHED_FIFO, a pinned core, locked memory and no GC',action = 'store_true')
+    args = parser.parse_args()
+    realtime = args.realtime
+
+    if SIOclient.available(args.socket):
+        print("SIOdaemon is already running on", args.socket)
+        exit()
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)  # stale socket from a crashed daemon
+
+    # configure every pin once and keep it that way
+    SIOapplyandplunge.setuppins()
+    SIOedges.watcher(pin.irsensor)
+    SIOedges.watcher(pin.interlock)
+    if realtime:
+        SIOrealtime.lockmemory()
+
+    server = Server(args.socket, Handler)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("SIOdaemon listening on", args.socket, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        # leave the hardware in a safe state
+        SIOapplyandplunge.resetplunger(pin.plunger)
+        SIOapplyandplunge.powerdownsensors(pin.sensorpower)
+        GPIO.output(pin.cannonposition,GPIO.LOW)
+        SIOedges.stopall()
+        GPIO.cleanup()
+        print("Done!")
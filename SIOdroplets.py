@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# droplet detection (count, size distribution, spray coverage) next to the
+# camera pipeline instead of in it: the FrameThread view copies a frame into a
+# free slot of a shared memory block and hands the slot number to a process
+# pool, which runs grey + median blur + HoughCircles on it. When every slot is
+# busy the frame is skipped for analysis, so capture and preview never wait.
+# Results are published to subscribers from the pool's result thread.
+
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import time
+import numpy
+import cv2
+from SIOmetrics import metrics
+
+RADII = [0, 2, 4, 8, 16, 32, 64, 128]   # histogram bin edges in pixels
+
+# worker side: the shared frames are attached once per process
+block = None
+frames = None
+
+def attach(name, shape):
+    global frames, block
+    block = shared_memory.SharedMemory(name=name)
+    frames = numpy.ndarray(shape, numpy.uint8, buffer=block.buf)
+
+def analyse(slot, minradius, maxradius):
+    """Droplets in one shared frame: count, radii, radius histogram and the
+    fraction of the frame they cover
+    """
+    image = frames[slot]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    gray = cv2.medianBlur(gray, 5)
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, 1.2, 2 * max(1, minradius),
+                               param1=100, param2=20, minRadius=minradius, maxRadius=maxradius)
+    circles = [] if circles is None else numpy.round(circles[0]).astype(int)
+    mask = numpy.zeros(gray.shape, numpy.uint8)
+    for x, y, r in circles:
+        cv2.circle(mask, (int(x), int(y)), int(r), 1, -1)
+    radii = [int(r) for x, y, r in circles]
+    return {'slot': slot,
+            'count': len(radii),
+            'radii': radii,
+            'histogram': numpy.histogram(radii, RADII)[0].tolist(),
+            'coverage': float(mask.mean())}
+
+class DropletAnalyzer:
+    """FrameThread view that analyses frames on a process pool, `slots`
+    frames at most in flight; subscribe(callback) to get every result dict
+    """
+    def __init__(self, shape, slots=4, processes=2, minradius=2, maxradius=64):
+        self.shape = (slots,) + tuple(shape)
+        self.block = shared_memory.SharedMemory(create=True, size=int(numpy.prod(self.shape)))
+        self.frames = numpy.ndarray(self.shape, numpy.uint8, buffer=self.block.buf)
+        self.free = list(range(slots))
+        self.stamps = [None] * slots
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.radius = (minradius, maxradius)
+        self.analysed = 0
+        self.skipped = 0
+        # spawn, a forked child would inherit the camera and Qt threads
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(processes, initializer=attach, initargs=(self.block.name, self.shape))
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.listeners = self.listeners + [callback]
+
+    def handle(self, image_data):
+        with self.lock:
+            slot = self.free.pop() if self.free else None
+        if slot is None:
+            self.skipped += 1
+            metrics.count('analysis skipped')
+        else:
+            self.frames[slot] = image_data.as_1d_image()
+            self.stamps[slot] = (image_data.frame, image_data.timestamp)
+            if not image_data.valid():
+                # overwritten in a SIOcamproc ring while it was copied
+                with self.lock:
+                    self.free.append(slot)
+                slot = None
+                self.skipped += 1
+                metrics.count('analysis skipped')
+        image_data.unlock()
+        if slot is not None:
+            self.pool.apply_async(analyse, (slot,) + self.radius, callback=self.publish,
+                                  error_callback=lambda error, slot=slot: self.failed(slot, error))
+
+    def publish(self, result):
+        slot = result['slot']
+        result['frame'], result['timestamp'] = self.stamps[slot]
+        with self.lock:
+            self.free.append(slot)
+        self.analysed += 1
+        metrics.count('analysed')
+        if result['timestamp'] is not None:
+            metrics.latency('capture to analysis', time.monotonic_ns() - result['timestamp'])
+        for callback in self.listeners:
+            callback(result)
+
+    def failed(self, slot, error):
+        print(f"[SIOdroplets] analysis failed: {error}")
+        with self.lock:
+            self.free.append(slot)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        del self.frames
+        self.block.close()
+        self.block.unlink()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# edge events for the input pins instead of polling GPIO.input in a loop.
+# With the GPIO character device (libgpiod) every edge carries a kernel
+# CLOCK_MONOTONIC timestamp, on the same clock as time.monotonic_ns(). Without
+# it RPi.GPIO's add_event_detect is used and the edge is stamped in its
+# callback thread. Either way the waiting thread sleeps in the kernel.
+
+import SIOgpio
+from SIOgpio import GPIO
+import os, time, threading
+import SIOpinlist as pin
+try:
+    import gpiod
+    from gpiod.line import Edge, Bias
+except ImportError:
+    gpiod = None
+
+GPIOCHIP = os.environ.get('SIO_GPIOCHIP', '/dev/gpiochip0')
+
+class EdgeWatcher:
+    """Watches one input pin and calls every listener with (level, timestamp_ns)"""
+    def __init__(self, pin):
+        self.pin = pin
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.request = None
+        self.thread = None
+        self.running = False
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.listeners = self.listeners + [callback]
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.listeners = [c for c in self.listeners if c is not callback]
+
+    def notify(self, level, timestamp):
+        for callback in self.listeners:
+            callback(level, timestamp)
+
+    def start(self):
+        self.running = True
+        if gpiod is not None and SIOgpio.hardware and os.path.exists(GPIOCHIP):
+            settings = gpiod.LineSettings(edge_detection=Edge.BOTH, bias=Bias.PULL_DOWN)
+            self.request = gpiod.request_lines(GPIOCHIP, consumer='SIO',
+                                               config={self.pin: settings})
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        else:
+            GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self.gpio_edge)
+
+    def run(self):
+        rising = gpiod.EdgeEvent.Type.RISING_EDGE
+        while self.running:
+            # blocks in poll(), the timeout only bounds how long stop() takes
+            if self.request.wait_edge_events(0.1):
+                for event in self.request.read_edge_events():
+                    self.notify(int(event.event_type == rising), event.timestamp_ns)
+
+    def gpio_edge(self, channel):
+        self.notify(GPIO.input(channel), time.monotonic_ns())
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.request.release()
+        else:
+            GPIO.remove_event_detect(self.pin)
+
+watchers = {}
+
+def watcher(pin):
+    """Shared, started watcher for a pin"""
+    if pin not in watchers:
+        watchers[pin] = EdgeWatcher(pin)
+        watchers[pin].start()
+    return watchers[pin]
+
+def stopall():
+    for w in watchers.values():
+        w.stop()
+    watchers.clear()
+
+class ImmersionTimer:
+    """Timestamp of the first rising edge of the plunger IR sensor after t0,
+    or with level=0 of the first falling one (the plunger leaving it)
+    """
+    def __init__(self, irsensor=pin.irsensor, level=1):
+        self.level = level
+        self.t0 = None
+        self.edge = None
+        self.detected = threading.Event()
+        self.watcher = watcher(irsensor)
+        self.watcher.subscribe(self.on_edge)
+
+    def start(self, t0):
+        self.t0 = t0
+
+    def on_edge(self, level, timestamp):
+        if level == self.level and self.t0 is not None and self.edge is None and timestamp >= self.t0:
+            self.edge = timestamp
+            self.detected.set()
+
+    def result(self, timeout=0):
+        """Seconds from t0 to immersion (or the edge), None if the sensor did not fire"""
+        self.detected.wait(timeout)
+        self.watcher.unsubscribe(self.on_edge)
+        if self.edge is None:
+            return None
+        return (self.edge - self.t0) / 1e9
+
+class InterlockWatchdog:
+    """Calls on_open(timestamp_ns) on the first rising edge of the cryogen
+    interlock (the container was lifted) until stop(); nothing polls it
+    """
+    def __init__(self, on_open, interlock=pin.interlock):
+        self.on_open = on_open
+        self.opened = None
+        self.watcher = watcher(interlock)
+        self.watcher.subscribe(self.on_edge)
+
+    def on_edge(self, level, timestamp):
+        if level and self.opened is None:
+            self.opened = timestamp
+            self.on_open(timestamp)
+
+    def stop(self):
+        self.watcher.unsubscribe(self.on_edge)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# picks the GPIO backend once for every SIO script instead of swapping the
+# import lines by hand. Set SIO_GPIO to
+#   rpi  - RPi.GPIO on the Pi (default)
+#   mock - Mock.GPIO
+#   sim  - SIOsim, simulated hardware on a virtual clock
+
+import os
+
+backend = os.environ.get('SIO_GPIO', 'rpi')
+
+if backend == 'sim':
+    import SIOsim
+    GPIO = SIOsim.install()
+elif backend == 'mock':
+    import Mock.GPIO as GPIO
+else:
+    import RPi.GPIO as GPIO
+
+# False when a stand-in was installed in place of RPi.GPIO
+hardware = backend == 'rpi' and not getattr(GPIO, 'standin', False)
@@ -8,17 +8,30 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.label import Label
 from kivy.uix.checkbox import CheckBox
 from kivy.uix.widget import Widget
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.core.window import Window
 from kivy.graphics import Color, Rectangle, Ellipse
 from kivy.clock import Clock
-from subprocess import call, Popen
+from subprocess import Popen, PIPE, STDOUT
 from datetime import datetime
-from threading import Thread
+from threading import Thread, Lock
+import time
+from collections import deque
+import os
+import signal
+import SIOclient
 
 # Set window size for 1280x720 display minus taskbar and title bar
 Window.size = (1280, 640)
 
+# Seconds between attempts to reach SIOdaemon's status stream
+STATUS_RETRY = 2
+
+# Full message history, the terminal itself only keeps the last TERMINAL_LINES
+LOGFILE = os.environ.get('SIO_LOG', 'SIOgui.log')
+TERMINAL_LINES = 1000
+
 # Color palette
 COLORS = {
     "bg": (0.04, 0.07, 0.13, 1),         # #0b1220
@@ -31,6 +44,100 @@ COLORS = {
 }
 
 
+class JobRunner:
+    """Runs SIO commands off the UI thread and streams their output, line by
+    line as it arrives, into the terminal through Clock.schedule_once
+    """
+    def __init__(self):
+        self.terminal = None  # Will be set by main app
+        self.thread = None
+        self.job = None         # (cmd, Popen) of a script run without the daemon
+        self.control = None     # pre-opened SIOclient.Control for abort
+        self.control_lock = Lock()  # UI thread and job threads share it
+    
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+    
+    def connect(self):
+        """Open the control connection ahead of an abort, if the daemon runs"""
+        with self.control_lock:
+            return self._connect()
+    
+    def _connect(self):
+        if self.control is None and SIOclient.available():
+            try:
+                self.control = SIOclient.Control()
+            except OSError:
+                self.control = None
+        return self.control
+    
+    def abort(self):
+        """Stop a running shot now: over the control connection to SIOdaemon,
+        or by signalling SIOapplyandplunge.py; the daemon's reply or None
+        """
+        with self.control_lock:
+            for attempt in range(2):
+                if self._connect() is None:
+                    break
+                try:
+                    return self.control.abort()
+                except OSError:
+                    # the daemon was restarted, reconnect once
+                    self.control.close()
+                    self.control = None
+        if self.job is not None:
+            cmd, process = self.job
+            if cmd == 'applyandplunge' and process.poll() is None:
+                process.send_signal(signal.SIGUSR1)
+        return None
+    
+    def run(self, cmd, arguments, on_done=None, **params):
+        """Run cmd on SIOdaemon, or the script in arguments if the daemon is not
+        running (daemon-only commands have no arguments); on_done(ok) is
+        called on the UI thread when it has finished. It starts once the
+        previous command is done, which holds the hardware until then
+        """
+        previous = self.thread
+        self.thread = Thread(target=self._run, args=(cmd, arguments, on_done, params, previous), daemon=True)
+        self.thread.start()
+    
+    def _post(self, message, msg_type='info'):
+        if self.terminal:
+            Clock.schedule_once(lambda dt: self.terminal.add_message(message, msg_type), 0)
+    
+    def _run(self, cmd, arguments, on_done, params, previous=None):
+        if previous is not None:
+            previous.join()
+        ok = False
+        try:
+            if SIOclient.available():
+                self.connect()
+                for reply in SIOclient.request(cmd, **params):
+                    if 'line' in reply:
+                        self._post(reply['line'])
+                    elif 'error' in reply:
+                        self._post(reply['error'], 'error')
+                    else:
+                        ok = reply.get('done', False)
+            elif not arguments:
+                self._post(f'{cmd} needs SIOdaemon, which is not running', 'error')
+            else:
+                # unbuffered, so every line shows up as soon as it is printed
+                process = Popen(arguments[:1] + ["-u"] + arguments[1:],
+                                stdout=PIPE, stderr=STDOUT, text=True)
+                self.job = (cmd, process)
+                for line in process.stdout:
+                    self._post(line.rstrip('\n'))
+                ok = process.wait() == 0
+        except Exception as e:
+            # whatever went wrong, on_done must run or the panel stays busy
+            self._post(f'{cmd} failed: {e}', 'error')
+        finally:
+            self.job = None
+            if on_done:
+                Clock.schedule_once(lambda dt: on_done(ok), 0)
+
+
 class NumericInputRow(BoxLayout):
     """Custom widget for numeric input with +/- buttons"""
     def __init__(self, label_text, default_value="5", step=1, **kwargs):
@@ -117,6 +224,8 @@ class ControlPanel(BoxLayout):
         self.padding = 10
         self.spacing = 8
         self.terminal = None  # Will be set by main app
+        self.runner = None  # Will be set by main app
+        self.armed = None  # Shot settings SIOdaemon is armed with
         
         # Add background color
         with self.canvas.before:
@@ -248,26 +357,67 @@ class ControlPanel(BoxLayout):
         self.rect.pos = instance.pos
         self.rect.size = instance.size
     
+    def _check_idle(self):
+        if self.runner.busy():
+            if self.terminal:
+                self.terminal.add_message('Another operation is still running', 'warning')
+            return False
+        return True
+    
     def power_up(self, instance):
+        if not self._check_idle():
+            return
         if self.terminal:
             self.terminal.add_message('Powering up system...', 'info')
         arguments = ["python3", "SIOpowerupdown.py", "--updown", "up"]
-        call(arguments)
-        self.start_btn.disabled = False
+        self.runner.run('powerupdown', arguments, self._powered_up, updown='up')
+    
+    def _powered_up(self, ok):
+        self.start_btn.disabled = not ok
         if self.terminal:
-            self.terminal.add_message('System powered up', 'success')
+            if ok:
+                self.terminal.add_message('System powered up', 'success')
+            else:
+                self.terminal.add_message('Power up failed', 'error')
+        if ok and SIOclient.available():
+            # pre-arm the shot so Spray & Plunge only has to fire it
+            shot = self._shot_settings()
+            self.runner.run('arm', [], lambda armed: self._armed(shot, armed), **shot)
+    
+    def _shot_settings(self):
+        return {'stime': float(self.spray_time.get_value()) / 1000,
+                'pdelay': float(self.plunge_delay.get_value()) / 1000,
+                'donotplunge': self.donotplunge_check.active}
+    
+    def _armed(self, shot, ok):
+        self.armed = shot if ok else None
+        if ok and self.terminal:
+            self.terminal.add_message('Armed, Spray & Plunge fires immediately', 'success')
     
     def power_down(self, instance):
+        # Abort does not wait for a running operation: first stop the shot and
+        # drive the actuators safe, then power down once it has let go of the hardware
         print("Power down")
+        reply = self.runner.abort()
         if self.terminal:
+            if reply and 'result' in reply:
+                self.terminal.add_message(f"Aborted, pins safe in {reply['result']['latency'] * 1e6:.0f} us", 'warning')
             self.terminal.add_message('Powering down system...', 'warning')
         arguments = ["python3", "SIOpowerupdown.py", "--updown", "down"]
-        call(arguments)
         self.start_btn.disabled = True
+        self.armed = None
+        self.runner.run('powerupdown', arguments, self._powered_down, updown='down')
+    
+    def _powered_down(self, ok):
         if self.terminal:
-            self.terminal.add_message('System powered down', 'info')
+            if ok:
+                self.terminal.add_message('System powered down', 'info')
+            else:
+                self.terminal.add_message('Power down failed', 'error')
     
     def start_process(self, instance):
+        if not self._check_idle():
+            return
         print("Starting process")
         spraytime = str(float(self.spray_time.get_value()) / 1000)
         plungedelay = str(float(self.plunge_delay.get_value()) / 1000)
@@ -278,10 +428,20 @@ class ControlPanel(BoxLayout):
             arguments.append("--donotplunge")
             if self.terminal:
                 self.terminal.add_message('Plunge disabled', 'warning')
-        call(arguments)
         self.start_btn.disabled = True
+        shot, armed, self.armed = self._shot_settings(), self.armed, None
+        if shot == armed and SIOclient.available():
+            self.runner.run('fire', [], self._process_done)
+        else:
+            # settings changed since arming, or no daemon: run the whole cycle
+            self.runner.run('applyandplunge', arguments, self._process_done, **shot)
+    
+    def _process_done(self, ok):
         if self.terminal:
-            self.terminal.add_message('Process completed', 'success')
+            if ok:
+                self.terminal.add_message('Process completed', 'success')
+            else:
+                self.terminal.add_message('Process did not run', 'error')
 
 
 class CleaningPanel(BoxLayout):
@@ -292,6 +452,7 @@ class CleaningPanel(BoxLayout):
         self.padding = 10
         self.spacing = 8
         self.terminal = None  # Will be set by main app
+        self.runner = None  # Will be set by main app
         
         # Add background color
         with self.canvas.before:
@@ -347,35 +508,60 @@ class CleaningPanel(BoxLayout):
         self.rect.size = instance.size
     
     def clean_process(self, instance):
+        if self.runner.busy():
+            if self.terminal:
+                self.terminal.add_message('Another operation is still running', 'warning')
+            return
         print("Starting clean process")
         spraytime = str(float(self.clean_pulse.get_value()) / 1000)
         cycles = self.clean_cycles.get_value()
         if self.terminal:
             self.terminal.add_message(f'Starting cleaning ({cycles} cycles, {spraytime}s pulse)', 'info')
         arguments = ["python3", "SIOclean.py", "--stime", spraytime, "--cycles", cycles]
-        process = Popen(arguments)
-        
-        # Monitor process completion in background thread
-        def wait_for_completion():
-            process.wait()
-            if self.terminal:
-                # Schedule GUI update on main thread
-                Clock.schedule_once(lambda dt: self.terminal.add_message('Cleaning process completed', 'success'), 0)
-        
-        Thread(target=wait_for_completion, daemon=True).start()
+        self.runner.run('clean', arguments, self._clean_done, stime=float(spraytime), cycles=int(cycles))
         
         if self.terminal:
             self.terminal.add_message('Cleaning process launched', 'success')
+    
+    def _clean_done(self, ok):
+        if self.terminal:
+            if ok:
+                self.terminal.add_message('Cleaning process completed', 'success')
+            else:
+                self.terminal.add_message('Cleaning process failed', 'error')
 
 
-class TerminalBox(BoxLayout):
-    """Terminal-style message display box"""
+class TerminalLine(Label):
+    """One line of the terminal, recycled by the RecycleView"""
     def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.font_name = 'RobotoMono-Regular'
+        self.font_size = '12sp'
+        self.color = COLORS["text"]
+        self.halign = 'left'
+        self.valign = 'middle'
+        self.bind(size=self.setter('text_size'))
+
+
+class TerminalBox(BoxLayout):
+    """Terminal-style message display box
+    Messages go to a fixed-size ring buffer shown through a RecycleView, so
+    only the visible lines are laid out. Messages added in the same frame are
+    drawn in one update and the full history is appended to LOGFILE.
+    """
+    def __init__(self, capacity=TERMINAL_LINES, logfile=LOGFILE, **kwargs):
         super().__init__(**kwargs)
         self.orientation = 'vertical'
         self.size_hint_y = 0.4
         self.padding = 6
         self.spacing = 8
+        self.lines = deque(['[System ready]'], maxlen=capacity)
+        self.pending = []
+        self.log = open(logfile, 'a')
+        self._redraw = Clock.create_trigger(self._flush)
+        # the RecycleView lays new data out before the next frame, scrolling
+        # has to come after that
+        self._follow = Clock.create_trigger(self._scroll_to_end, 0)
         
         # Add background color
         with self.canvas.before:
@@ -396,28 +582,26 @@ class TerminalBox(BoxLayout):
         )
         header.bind(size=header.setter('text_size'))
         
-        # Scrollable text area
-        self.scroll_view = ScrollView(
+        # Scrollable line view, only the visible lines get widgets
+        self.scroll_view = RecycleView(
             size_hint=(1, 1),
             do_scroll_x=False,
             do_scroll_y=True,
             scroll_type=['bars', 'content'],
             bar_width=10
         )
+        self.scroll_view.viewclass = TerminalLine
         
-        self.terminal_text = TextInput(
-            text='[System ready]\n',
-            readonly=True,
-            font_name='RobotoMono-Regular',
-            font_size='12sp',
-            background_color=COLORS["bg"],
-            foreground_color=COLORS["text"],
-            cursor_color=(0, 0, 0, 0),  # Hide cursor
-            size_hint_y=None
+        line_layout = RecycleBoxLayout(
+            orientation='vertical',
+            size_hint_y=None,
+            default_size=(None, 18),
+            default_size_hint=(1, None)
         )
-        self.terminal_text.bind(minimum_height=self.terminal_text.setter('height'))
+        line_layout.bind(minimum_height=line_layout.setter('height'))
         
-        self.scroll_view.add_widget(self.terminal_text)
+        self.scroll_view.add_widget(line_layout)
+        self.scroll_view.data = [{'text': line} for line in self.lines]
         
         self.add_widget(header)
         self.add_widget(self.scroll_view)
@@ -442,15 +626,36 @@ class TerminalBox(BoxLayout):
         else:
             prefix = '[INFO]'
         
-        formatted_msg = f'{timestamp} {prefix} {message}\n'
-        self.terminal_text.text += formatted_msg
-        
+        self.pending.append(f'{timestamp} {prefix} {message}')
+        self._redraw()
+    
+    def _flush(self, dt):
+        """Draw everything added since the last frame in one go"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        date = datetime.now().strftime('%Y-%m-%d')
+        self.log.write(''.join(f'{date} {line}\n' for line in pending))
+        self.log.flush()
+        
+        self.lines.extend(pending)
+        self.scroll_view.data = [{'text': line} for line in self.lines]
+        self._follow()
+    
+    def _scroll_to_end(self, dt):
         # Auto-scroll to bottom - force scroll view to bottom
         self.scroll_view.scroll_y = 0
     
+    def close(self):
+        """Write what is still pending and close the log file"""
+        self._flush(0)
+        self.log.close()
+    
     def clear(self):
         """Clear all messages"""
-        self.terminal_text.text = ''
+        self.pending = []
+        self.lines.clear()
+        self.scroll_view.data = []
 
 
 class StatusIndicator(Widget):
@@ -540,8 +745,10 @@ class StatusBar(BoxLayout):
         self.rect.size = instance.size
     
     def set_cryostat_status(self, active):
-        """Update cryostat interlock status - True = OK (green), False = Error (red)"""
-        if active:
+        """Update cryostat interlock status - True = OK (green), False = Error (red), None = unknown"""
+        if active is None:
+            self.cryostat_indicator.set_color(COLORS["muted"])
+        elif active:
             self.cryostat_indicator.set_color(COLORS["accent"])
         else:
             self.cryostat_indicator.set_color(COLORS["danger"])
@@ -556,6 +763,46 @@ class StatusBar(BoxLayout):
             self.plunger_indicator.set_color(COLORS["muted"])
 
 
+class StatusMonitor:
+    """Follows the cryostat interlock and plunger IR sensor through SIOdaemon's
+    edge-driven status stream and updates the StatusBar at most once per frame
+    """
+    def __init__(self, status_bar):
+        self.status_bar = status_bar
+        self.latest = None
+        self.running = True
+        self._update = Clock.create_trigger(self._apply)
+        Thread(target=self._run, daemon=True).start()
+    
+    def _run(self):
+        while self.running:
+            try:
+                if SIOclient.available():
+                    for reply in SIOclient.request('status'):
+                        if 'status' in reply:
+                            self.latest = reply['status']
+                            self._update()
+            except (OSError, ValueError):
+                pass
+            # daemon not running or gone: state unknown until it is back
+            self.latest = None
+            self._update()
+            time.sleep(STATUS_RETRY)
+    
+    def _apply(self, dt):
+        status = self.latest
+        if status is None:
+            self.status_bar.set_cryostat_status(None)
+            self.status_bar.set_plunger_status('unknown')
+        else:
+            # reed switch pulls the interlock low when the container is seated
+            self.status_bar.set_cryostat_status(status['interlock'] == 0)
+            self.status_bar.set_plunger_status('down' if status['irsensor'] else 'up')
+    
+    def stop(self):
+        self.running = False
+
+
 class ShakeItOffApp(App):
     def build(self):
         # Set window background color
@@ -629,11 +876,24 @@ class ShakeItOffApp(App):
         self.control_panel.terminal = self.terminal
         self.cleaning_panel.terminal = self.terminal
         
+        # Hardware operations run off the UI thread, one at a time
+        self.runner = JobRunner()
+        self.runner.terminal = self.terminal
+        self.control_panel.runner = self.runner
+        self.cleaning_panel.runner = self.runner
+        
+        # Live interlock and plunger indicators
+        self.status_monitor = StatusMonitor(self.status_bar)
+        
         # Initial messages
         self.terminal.add_message('System initialized', 'success')
         self.terminal.add_message('Ready for operations', 'info')
         
         return main_layout
+    
+    def on_stop(self):
+        self.status_monitor.stop()
+        self.terminal.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# counters and latency histograms for the camera pipeline (FrameThread, the
+# preview, recorder and analysis views), so buffer count and AOI can be sized
+# from data. Counters are written from the capture thread and the view threads
+# (a buffer is unlocked by whichever view is last), so every update takes one
+# short lock. snapshot() and report() can be called from anywhere and change
+# nothing: a reader that wants rates passes its own previous snapshot. The
+# preview can draw report() as an overlay.
+
+import time, threading
+
+class Histogram:
+    """Latencies in power-of-two microsecond buckets"""
+    def __init__(self):
+        self.buckets = [0] * 40
+        self.count = 0
+        self.total = 0
+        self.largest = 0
+
+    def add(self, ns):
+        us = max(0, int(ns) // 1000)
+        self.buckets[min(us.bit_length(), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += ns
+        self.largest = max(self.largest, ns)
+
+    def percentile(self, fraction):
+        """Upper bound in ns of the bucket holding that fraction of the samples"""
+        wanted = fraction * self.count
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= wanted:
+                return (1 << bucket) * 1000
+        return 0
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}        # name: [current, largest]
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.since = time.monotonic_ns()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self.lock:
+            current = self.gauges.setdefault(name, [0, 0])
+            current[0] = value
+            current[1] = max(current[1], value)
+
+    def latency(self, name, ns):
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).add(ns)
+
+    def snapshot(self, previous=None):
+        """Counters, rates per second since the previous snapshot of the same
+        reader (since the start without one), gauges and latency percentiles in ms
+        """
+        with self.lock:
+            now = time.monotonic_ns()
+            counters = dict(self.counters)
+            gauges = {name: tuple(value) for name, value in self.gauges.items()}
+            latency = {name: {'count': h.count,
+                              'mean': h.total / max(1, h.count) / 1e6,
+                              'p50': h.percentile(0.5) / 1e6,
+                              'p99': h.percentile(0.99) / 1e6,
+                              'max': h.largest / 1e6}
+                       for name, h in self.histograms.items()}
+        if previous is None or previous['time'] < self.since:
+            then, before = self.since, {}
+        else:
+            then, before = previous['time'], previous['counters']
+        seconds = max(1e-9, (now - then) / 1e9)
+        return {'time': now, 'counters': counters,
+                'rates': {name: (n - before.get(name, 0)) / seconds for name, n in counters.items()},
+                'gauges': gauges, 'latency': latency}
+
+    def report(self, snapshot=None):
+        """Lines of text for the console or the preview overlay"""
+        snapshot = snapshot or self.snapshot()
+        lines = [f"{name}: {n} ({snapshot['rates'][name]:.1f}/s)" for name, n in sorted(snapshot['counters'].items())]
+        lines += [f"{name}: {current} (max {largest})" for name, (current, largest) in sorted(snapshot['gauges'].items())]
+        lines += [f"{name}: mean {h['mean']:.2f} p50 <{h['p50']:.2f} p99 <{h['p99']:.2f} max {h['max']:.2f} ms"
+                  for name, h in sorted(snapshot['latency'].items())]
+        return lines
+
+    def reset(self):
+        with self.lock:
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+            self.since = time.monotonic_ns()
+
+# shared by every stage of the pipeline in this process
+metrics = Metrics()
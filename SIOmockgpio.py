@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# recording stand-in for RPi.GPIO so the sequence code runs on a plain Linux
+# box: every GPIO.output call is recorded with a time.monotonic_ns() timestamp
+# and inputs can be driven from outside, firing add_event_detect callbacks
+
+import sys, time, types, threading
+
+class RecordingGPIO:
+    standin = True
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.records = []   # (timestamp, pin, level) of every output call
+        self.levels = {}
+        self.callbacks = {}
+        self.lock = threading.Lock()
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=None, initial=None):
+        if initial is not None:
+            self.levels[channel] = initial
+        else:
+            self.levels.setdefault(channel, 0)
+
+    def output(self, channel, level):
+        self.records.append((time.monotonic_ns(), channel, int(level)))
+        self.levels[channel] = int(level)
+
+    def input(self, channel):
+        return self.levels.get(channel, 0)
+
+    def cleanup(self, channel=None):
+        self.callbacks.clear()
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        self.callbacks[channel] = (edge, callback)
+
+    def remove_event_detect(self, channel):
+        self.callbacks.pop(channel, None)
+
+    def set_input(self, channel, level):
+        """Drive an input pin, firing its event callback on a matching edge"""
+        with self.lock:
+            previous = self.levels.get(channel, 0)
+            self.levels[channel] = level
+        if channel in self.callbacks and previous != level:
+            edge, callback = self.callbacks[channel]
+            if edge == self.BOTH or edge == (self.RISING if level else self.FALLING):
+                if callback is not None:
+                    callback(channel)
+
+    def clear(self):
+        self.records = []
+
+def install(gpio=None):
+    """Make `import RPi.GPIO as GPIO` return the stand-in, must run before the SIO modules are imported"""
+    if gpio is None:
+        gpio = RecordingGPIO()
+    package = types.ModuleType('RPi')
+    package.GPIO = gpio
+    sys.modules['RPi'] = package
+    sys.modules['RPi.GPIO'] = gpio
+    return gpio
@@ -16,3 +16,11 @@ O_spray_ctrl              = 16 #pi36
 # 3) Cryostat sensor (interlock) changed to simple reed switch and pin to pullup. (switch normally open, when closed it pulls down pin to gnd)
 
 
+
+# names used by the control scripts
+cannon         = O_spray_ctrl          # piezo spray pulse
+cannonposition = O_spray_solenoid      # advances/reverses the spray cannon
+plunger        = O_plunger_solenoid
+sensorpower    = O_cryostat_sensor_pwr
+irsensor       = I_plunger_irsensor_sig
+interlock      = I_cryostat_sensor_sig
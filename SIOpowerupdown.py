@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 
-# Uncomment for use of pi
-import RPi.GPIO as GPIO
-#import Mock.GPIO as GPIO
+from SIOgpio import GPIO
 import time, threading
 import argparse
 import sys, select
 import SIOpinlist as pin
+import SIOclient
 
 def cannonforward(cannonposition):
     print("Advancing the cannon")
@@ -23,34 +22,46 @@ def cannonreverse(cannonposition,cannonreversedelay):
     print("reversing the cannon")
     GPIO.output(cannonposition,GPIO.LOW)
 
-if __name__=='__main__':
-    parser = argparse.ArgumentParser(description='Arguments for SIOpowerupdown')
-    parser.add_argument('--updown',      help='Power up or down',required=True)
-    args = parser.parse_args()
-
+def setuppins():
     GPIO.setwarnings(False)
-    GPIO.cleanup()    
+    # no GPIO.cleanup() here: it would drop the cannon position line
     GPIO.setmode(GPIO.BCM)
     GPIO.setup(pin.cannonposition,GPIO.OUT)
     GPIO.setup(pin.sensorpower,GPIO.OUT)
     GPIO.setup(pin.sensorpower,GPIO.OUT)
     GPIO.setup(pin.irsensor,GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
     GPIO.setup(pin.interlock,GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
-    
-    if args.updown == 'up':
+
+def powerupdown(updown):
+    """Power the sensors up and advance the cannon, or power down; False on interlock fail"""
+    if updown == 'up':
         # Power up sensors and check interlock
         powerupsensors(pin.sensorpower)
         if GPIO.input(pin.interlock)==1:
             print("Interlock fail: cryogen container is not in place")
             powerdownsensors(pin.sensorpower)
             cannonreverse(pin.cannonposition,0)
-            exit()
+            return False
         else:
             print("Safety interlock pass: cryogen container is in place")
             # put cannon into place and wait
             cannonforward(pin.cannonposition)
-    elif args.updown == 'down':
+    elif updown == 'down':
         powerdownsensors(pin.sensorpower)
         cannonreverse(pin.cannonposition,0)
-    print("Done!")
+    return True
 
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOpowerupdown')
+    parser.add_argument('--updown',      help='Power up or down',required=True)
+    args = parser.parse_args()
+
+    # hand over to SIOdaemon if it is running, it keeps the pins configured
+    if SIOclient.available():
+        reply = SIOclient.run('powerupdown', updown=args.updown)
+        sys.exit(0 if reply.get('done') else 1)
+
+    setuppins()
+    if not powerupdown(args.updown):
+        sys.exit(1)
+    print("Done!")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# opt-in real-time mode for the shot window: the thread that drives the edges
+# runs with SCHED_FIFO priority pinned to one core (an isolcpus= core if the
+# kernel has one), the process memory is locked with mlockall so nothing pages
+# in mid-shot, and the garbage collector is off while the edges are driven.
+# Each step needs privileges (root, or CAP_SYS_NICE and CAP_IPC_LOCK with a
+# memlock limit); whatever cannot be had is reported once and skipped, the
+# shot still fires. SIObench --realtime compares the edge jitter with and
+# without it.
+
+import os, gc, resource
+import ctypes, ctypes.util
+
+PRIORITY = 80   # SCHED_FIFO priority of the firing thread, above IRQ threads (50)
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+locked = False
+warned = set()
+
+def warn(step, error):
+    if step not in warned:
+        warned.add(step)
+        print(f"[SIOrealtime] {step} not available ({error.strerror}), continuing without it")
+
+def cpulist(text):
+    """CPUs of a kernel cpu list such as '2-3,5'"""
+    cpus = set()
+    for part in text.strip().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+def isolatedcpu():
+    """Highest isolated CPU, else the highest one this process may run on"""
+    try:
+        with open('/sys/devices/system/cpu/isolated') as f:
+            isolated = cpulist(f.read())
+    except OSError:
+        isolated = set()
+    return max(isolated or os.sched_getaffinity(0))
+
+def lockmemory():
+    """mlockall the process once, True if its memory is locked"""
+    global locked
+    if locked:
+        return True
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    # with a finite memlock limit MCL_FUTURE would make later allocations fail
+    # once the limit is reached, so only what is mapped now gets locked
+    soft, hard = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    flags = MCL_CURRENT | (MCL_FUTURE if soft == resource.RLIM_INFINITY else 0)
+    if libc.mlockall(flags) != 0:
+        error = ctypes.get_errno()
+        warn('mlockall', OSError(error, os.strerror(error)))
+        return False
+    locked = True
+    return True
+
+def prepare():
+    """The slow part, done when a shot is armed: lock memory and collect garbage"""
+    lockmemory()
+    gc.collect()
+
+class RealTime:
+    """Context for the shot window of the calling thread; does nothing unless enabled"""
+    def __init__(self, enabled=True, priority=PRIORITY, cpu=None):
+        self.enabled = enabled
+        self.priority = priority
+        self.cpu = cpu
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        self.collecting = gc.isenabled()
+        gc.disable()
+        # pid 0 is the calling thread for both of these
+        self.affinity = os.sched_getaffinity(0)
+        try:
+            os.sched_setaffinity(0, {isolatedcpu() if self.cpu is None else self.cpu})
+        except OSError as error:
+            warn('CPU affinity', error)
+        self.policy, self.param = os.sched_getscheduler(0), os.sched_getparam(0)
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+        except OSError as error:
+            warn('SCHED_FIFO', error)
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        if not self.enabled:
+            return
+        try:
+            os.sched_setscheduler(0, self.policy, self.param)
+        except OSError:
+            pass
+        try:
+            os.sched_setaffinity(0, self.affinity)
+        except OSError:
+            pass
+        if self.collecting:
+            gc.enable()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# declarative shot recipes: several spray pulses, a pre-wet pulse, spraying
+# while the plunger is already falling or plunging twice. A recipe compiles to
+# the same edge timeline SIOsequencer fires for a simple shot, so it runs with
+# the same timing. Conflicting actuators and thermal limits are checked when
+# the recipe is compiled, before anything is powered up.
+#
+# recipe file (JSON, or YAML if PyYAML is installed), times in seconds from t0
+#   {"name": "pre-wet and two bursts",
+#    "spray":   [{"at": 0, "time": 0.002, "name": "pre-wet"},
+#                {"at": 0.02, "time": 0.005}, {"at": 0.04, "time": 0.005}],
+#    "reverse": 0.045,
+#    "plunge":  [{"at": 0.05}],
+#    "clearance": 0}
+# reverse (cannon reverses) defaults to the end of the last spray pulse, a
+# plunge holds the plunger down for kuhnketime (default 1) unless it gives
+# "hold". clearance is how long the cannon may stay advanced after a plunger
+# release, i.e. the plunger travel time before it reaches the spray; only set it
+# from a measured travel time (at most 0.1 s, see LIMITS), spraying while
+# plunging relies on it. Times are effective times: the latencies of a
+# SIOcalibrate profile are fed forward.
+
+import json
+import argparse
+import functools
+import SIOpinlist as pin
+import SIOsequencer
+import SIOcalibrate
+from SIOsequencer import Edge, Plan, ns
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# thermal limits, a recipe may tighten but never relax them
+LIMITS = {'pulse':  0.5,    # longest single spray pulse (s), piezo heats up
+          'spray':  1.0,    # spray on-time of the whole shot (s)
+          'gap':    0.001,  # shortest pause between spray pulses (s)
+          'hold':   2.0,    # longest plunger hold (s), Kuhnke solenoid overheats
+          'clearance': 0.1} # longest the cannon may stay advanced after a release (s)
+
+def load(path):
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError("YAML recipes need PyYAML, use JSON instead")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+# keys of a step: spray pulses last `time`, plunges are held for `hold`
+STEPKEYS = {'spray': ('at', 'time', 'name'),
+            'plunge': ('at', 'hold', 'name')}
+
+def pulses(steps, kind):
+    """(start, end, name) of spray or plunge steps, sorted by start"""
+    keys = STEPKEYS[kind]
+    found = []
+    for number, step in enumerate(steps, 1):
+        name = step.get('name', f"{kind} {number}" if len(steps) > 1 else kind)
+        unknown = set(step) - set(keys)
+        if unknown:
+            raise ValueError(f"{name}: {', '.join(sorted(unknown))} does not apply to a {kind} step, "
+                             f"it may have {'/'.join(keys)}")
+        if 'at' not in step:
+            raise ValueError(f"{name}: a {kind} step needs at")
+        found.append((step['at'], step['at'] + step.get(keys[1], 0), name))
+    return sorted(found)
+
+def checklimits(sprays, plunges, limits, clearance=0):
+    if clearance < 0:
+        raise ValueError("clearance must not be negative")
+    if clearance > limits['clearance']:
+        raise ValueError(f"clearance {clearance} s exceeds the {limits['clearance']} s limit")
+    for start, end, name in sprays:
+        if end <= start:
+            raise ValueError(f"{name}: spray pulse needs a time > 0")
+        if end - start > limits['pulse']:
+            raise ValueError(f"{name}: {end - start} s pulse exceeds the {limits['pulse']} s limit")
+    if sum(end - start for start, end, name in sprays) > limits['spray']:
+        raise ValueError(f"Spray on-time exceeds the {limits['spray']} s limit of a shot")
+    for (start, end, name), (following, _, nextname) in zip(sprays, sprays[1:]):
+        if following - end < limits['gap']:
+            raise ValueError(f"{name} and {nextname} overlap or are less than {limits['gap']} s apart")
+    for start, end, name in plunges:
+        if end - start > limits['hold']:
+            raise ValueError(f"{name}: plunger held {end - start} s, limit is {limits['hold']} s")
+    for (start, end, name), (following, _, nextname) in zip(plunges, plunges[1:]):
+        if following < end:
+            raise ValueError(f"{nextname} starts before {name} has reset")
+
+def compilerecipe(recipe, latencies=()):
+    """Checked SIOsequencer.Plan of a recipe dict, raises ValueError if it is unsafe;
+    latencies as for SIOsequencer.plan()
+    """
+    # the canonical text is the cache key, dicts are not hashable
+    return compiled(json.dumps(recipe, sort_keys=True), latencies)
+
+@functools.lru_cache(maxsize=32)
+def compiled(text, latencies=()):
+    recipe = json.loads(text)
+    unknown = set(recipe) - {'name', 'spray', 'reverse', 'plunge', 'kuhnketime', 'clearance', 'limits'}
+    if unknown:
+        raise ValueError(f"unknown recipe keys: {', '.join(sorted(unknown))}")
+    kuhnketime = recipe.get('kuhnketime', 1)
+    limits = {key: min(value, recipe.get('limits', {}).get(key, value)) for key, value in LIMITS.items()}
+    sprays = pulses(recipe.get('spray', []), 'spray')
+    if not sprays:
+        raise ValueError("A recipe needs at least one spray pulse")
+    plunges = pulses([{'hold': kuhnketime, **step} for step in recipe.get('plunge', [])], 'plunge')
+    clearance = recipe.get('clearance', 0)
+    checklimits(sprays, plunges, limits, clearance)
+
+    reverse = recipe.get('reverse', sprays[-1][1])
+    edges = []
+    for start, end, name in sprays:
+        edges += [Edge(ns(start), pin.cannon, 1, f"{name} on"), Edge(ns(end), pin.cannon, 0, f"{name} off")]
+    edges.append(Edge(ns(reverse), pin.cannonposition, 0, 'cannon reverse'))
+    for start, end, name in plunges:
+        edges += [Edge(ns(start), pin.plunger, 1, f"{name} release"), Edge(ns(end), pin.plunger, 0, f"{name} reset")]
+    exittime = max([reverse] + [end for start, end, name in sprays + plunges])
+    edges.append(Edge(ns(exittime), pin.sensorpower, 0, 'sensor power off'))
+    edges = sorted(edges, key=lambda edge: edge.offset)
+
+    # the cannon may stay advanced for the plunger travel time after a release;
+    # checked before compensation, the recipe times are when the actuators move
+    first, second, allowed, message = SIOsequencer.CONFLICTS[0]
+    conflicts = [(first, second, ns(clearance), message)] + SIOsequencer.CONFLICTS[1:]
+    SIOsequencer.check(edges, conflicts)
+    edges, delay = SIOsequencer.compensate(edges, dict(latencies))
+    edges = tuple(edges)
+    return Plan(edges, exittime + delay / 1e9, delay)
+
+def show(plan):
+    # from the requested start, fed forward edges go out before it
+    print("Timeline:")
+    for edge in plan.edges:
+        print(f"  {(edge.offset - plan.delay) / 1e6:10.3f} ms  pin {edge.pin:<3} {'HIGH' if edge.level else 'LOW ':<5} {edge.name}")
+
+def run(recipe, waves=False, realtime=False, feedforward=True):
+    """Compile, arm and fire a recipe on configured pins, see SIOapplyandplunge.fire()"""
+    import SIOapplyandplunge
+    try:
+        plan = compilerecipe(recipe, SIOcalibrate.latencies() if feedforward else ())
+    except ValueError as error:
+        print(f"Recipe refused: {error}")
+        return False
+    show(plan)
+    shot = SIOapplyandplunge.armplan(plan, waves, realtime)
+    if shot is None:
+        return False
+    return SIOapplyandplunge.fire(shot)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOrecipe')
+    parser.add_argument('recipe',    help='Recipe file (JSON or YAML)')
+    parser.add_argument('--check',   help='Only compile and show the timeline',action = 'store_true')
+    parser.add_argument('--waves',   help='Time the edges with pigpio DMA waves',action = 'store_true')
+    parser.add_argument('--realtime',help='Fire with SCHED_FIFO, a pinned core, locked memory and no GC',action = 'store_true')
+    parser.add_argument('--nofeedforward',help='Ignore the SIOcalibrate latency profile',action = 'store_true')
+    args = parser.parse_args()
+
+    recipe = load(args.recipe)
+    print(f"[SIOrecipe] {recipe.get('name', args.recipe)}")
+    if args.check:
+        try:
+            show(compilerecipe(recipe, () if args.nofeedforward else SIOcalibrate.latencies()))
+        except ValueError as error:
+            print(f"Recipe refused: {error}")
+            exit(1)
+        exit(0)
+
+    import SIOclient
+    if SIOclient.available():
+        reply = SIOclient.run('recipe', recipe=recipe, waves=args.waves, realtime=args.realtime,
+                              feedforward=not args.nofeedforward)
+        exit(0 if reply.get('done') else 1)
+
+    import SIOapplyandplunge, SIOedges
+    from SIOgpio import GPIO
+    SIOapplyandplunge.setuppins()
+    ok = run(recipe, args.waves, args.realtime, not args.nofeedforward)
+    SIOedges.stopall()
+    GPIO.cleanup()
+    exit(0 if ok else 1)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# camera without a camera: ReplayCamera has the Camera interface FrameThread
+# uses and streams frames from a recorded clip (SIOcapture .npz or .npy) or a
+# synthetic droplet generator at a set rate and colour mode. It behaves like
+# the uEye buffer sequence: frames only land in free buffers (otherwise they
+# are lost and their frame numbers skipped), wait_next() hands out the oldest
+# filled buffer locked and unlock() gives it back. Run it directly to
+# benchmark FrameThread and the views behind it on any Linux box.
+
+import time, threading
+from collections import deque
+import argparse
+import numpy
+from pyueye_example_utils import ImageData, Rect, FrameThread
+from SIOmetrics import metrics
+
+# name: uEye IS_CM_* value, bytes per pixel
+COLORMODES = {'mono8': (6, 1), 'bgr8': (1, 3), 'bgra8': (0, 4)}
+
+def synthetic(width=400, height=400, channels=1, count=64, droplets=20, seed=0):
+    """Noisy grey frames with bright droplets drifting across"""
+    rng = numpy.random.default_rng(seed)
+    y, x = numpy.mgrid[0:height, 0:width]
+    centres = rng.uniform(0, 1, (droplets, 2)) * (width, height)
+    radii = rng.uniform(3, 15, droplets)
+    velocity = rng.normal(0, 3, (droplets, 2))
+    frames = numpy.empty((count, height, width, channels), numpy.uint8)
+    for number in range(count):
+        frame = rng.normal(40, 5, (height, width))
+        for (cx, cy), (vx, vy), r in zip(centres, velocity, radii):
+            frame[(x - cx - vx * number) ** 2 + (y - cy - vy * number) ** 2 < r * r] = 200
+        frames[number] = numpy.clip(frame, 0, 255)[:, :, None]
+    return frames
+
+def load(path):
+    """Frames of a SIOcapture clip (.npz) or a saved array (.npy)"""
+    data = numpy.load(path)
+    return data['frames'] if path.endswith('.npz') else data
+
+def conform(frames, channels):
+    """(n, height, width, channels) uint8 frames"""
+    frames = numpy.asarray(frames, numpy.uint8)
+    if frames.ndim == 3:
+        frames = frames[:, :, :, None]
+    if frames.shape[3] != channels:
+        grey = frames[:, :, :, :3].mean(axis=3, keepdims=True).astype(numpy.uint8)
+        frames = numpy.repeat(grey, channels, axis=3)
+    return frames
+
+class ReplayBuffer:
+    """A sequence buffer with what FrameThread and ImageData use of ImageBuffer"""
+    def __init__(self, mem_id, shape, color_mode, camera):
+        self.mem_id = mem_id
+        self.memory = numpy.zeros(shape, numpy.uint8)
+        self.image = self.memory if shape[2] > 1 else self.memory[:, :, 0]
+        self.mem_info = Rect(0, 0, shape[1], shape[0])
+        self.color_mode = color_mode
+        self.bits_per_pixel = 8 * shape[2]
+        self.camera = camera
+        self.filled = False     # holds a frame, queued or handed out
+        self.image_data = ImageData(None, self)
+
+class ReplayCamera:
+    def __init__(self, frames, fps=100, colormode='mono8'):
+        self.source = frames
+        self.fps = fps
+        self.colormode = colormode
+        self.aoi = None
+        self.img_buffers = []
+        self.buffer_ids = {}
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.info = {}
+        self.producer = None
+        self.running = False
+
+    def __enter__(self):
+        self.init()
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.exit()
+
+    def handle(self):
+        return self
+
+    def init(self):
+        return 0
+
+    def exit(self):
+        self.stop_video()
+
+    def set_colormode(self, colormode):
+        self.colormode = colormode
+
+    def get_colormode(self):
+        return COLORMODES[self.colormode][0]
+
+    def set_aoi(self, x, y, width, height):
+        self.aoi = (x, y, width, height)
+        return 0
+
+    def get_aoi(self):
+        height, width = self.frames().shape[1:3]
+        return Rect(0, 0, width, height)
+
+    def frames(self):
+        frames = conform(self.source, COLORMODES[self.colormode][1])
+        if self.aoi is not None:
+            x, y, width, height = self.aoi
+            frames = frames[:, y:y + height, x:x + width]
+        return frames
+
+    def alloc(self, buffer_count=3):
+        self.played = numpy.ascontiguousarray(self.frames())
+        self.img_buffers = [ReplayBuffer(mem_id, self.played.shape[1:], self.get_colormode(), self)
+                            for mem_id in range(1, buffer_count + 1)]
+        self.buffer_ids = {buff.mem_id: buff for buff in self.img_buffers}
+
+    def image_data(self, mem_id):
+        return self.buffer_ids[mem_id].image_data
+
+    def capture_video(self, wait=False):
+        self.running = True
+        self.producer = threading.Thread(target=self.produce, daemon=True)
+        self.producer.start()
+        return 0
+
+    def stop_video(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.producer is not None and self.producer is not threading.current_thread():
+            self.producer.join()
+        self.producer = None
+        return 0
+
+    def produce(self):
+        """The sensor: a frame every 1/fps s into the next free buffer"""
+        period = round(1e9 / self.fps)
+        start = next_frame = time.monotonic_ns()
+        number = 0
+        while self.running:
+            remaining = next_frame - time.monotonic_ns()
+            if remaining > 0:
+                time.sleep(remaining / 1e9)
+            captured = time.monotonic_ns()
+            number += 1
+            next_frame += period
+            with self.condition:
+                free = [buff for buff in self.img_buffers if not buff.filled]
+            if not free:
+                continue    # lost, like a camera with every buffer locked
+            buff = free[0]
+            buff.memory[:] = self.played[number % len(self.played)]
+            buff.filled = True
+            with self.condition:
+                self.info[buff.mem_id] = (number, (captured - start) // 100)
+                self.queue.append(buff.mem_id)
+                self.condition.notify()
+
+    def wait_next(self, timeout):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.queue or not self.running, timeout / 1000):
+                return None
+            return self.queue.popleft() if self.queue else None
+
+    def image_info(self, mem_id):
+        return self.info.get(mem_id)
+
+    def unlock(self, buff):
+        with self.condition:
+            buff.filled = False
+
+class Sink:
+    """View that only gives the frame back"""
+    def handle(self, image_data):
+        image_data.unlock()
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOreplay')
+    parser.add_argument('--source',    help='Clip (.npz/.npy) to replay, or synthetic',default = 'synthetic', required=False)
+    parser.add_argument('--fps',       help='Frame rate to replay at',default = 200, type=float,required=False)
+    parser.add_argument('--colormode', help='Colour mode',default = 'mono8', choices=sorted(COLORMODES), required=False)
+    parser.add_argument('--size',      help='Width and height of synthetic frames',nargs=2, default = [400, 400], type=int,required=False)
+    parser.add_argument('--buffers',   help='Camera sequence buffers',default = 3, type=int,required=False)
+    parser.add_argument('--seconds',   help='How long to run',default = 5, type=float,required=False)
+    parser.add_argument('--views',     help='Views behind FrameThread: sink ring droplets',nargs='+', default = ['sink'], required=False)
+    args = parser.parse_args()
+
+    if args.source == 'synthetic':
+        frames = synthetic(*args.size)
+    else:
+        frames = load(args.source)
+    cam = ReplayCamera(frames, args.fps, args.colormode)
+    cam.init()
+    cam.alloc(args.buffers)
+    shape = cam.img_buffers[0].image.shape
+    views = []
+    for name in args.views:
+        if name == 'ring':
+            from SIOcapture import FrameRing
+            views.append(FrameRing(shape))
+        elif name == 'droplets':
+            from SIOdroplets import DropletAnalyzer
+            views.append(DropletAnalyzer(shape))
+        else:
+            views.append(Sink())
+
+    thread = FrameThread(cam, views)
+    cam.capture_video()
+    thread.start()
+    before = metrics.snapshot()
+    time.sleep(args.seconds)
+    snapshot = metrics.snapshot(before)
+    thread.stop()
+    thread.join()
+    for view in views:
+        if hasattr(view, 'close'):
+            view.close()
+    print(f"[SIOreplay] {args.source} at {args.fps} fps, {args.colormode} {shape}, {args.buffers} buffers")
+    print("\n".join(metrics.report(snapshot)))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# absolute-deadline sequencer: the spray/plunge timeline is turned into a sorted
+# list of edges with time.monotonic_ns() deadlines from one t0 and fired from a
+# single thread, sleeping coarsely and spinning for the last stretch, so thread
+# start skew and sleep overshoot no longer add to the requested delays.
+# plan() checks a timeline for conflicting actuators once and caches it.
+# A Cancel lets another thread stop a running fire() between two edges.
+# compensate() feeds the actuator latencies measured by SIOcalibrate forward.
+
+import time, functools, threading
+from collections import namedtuple
+import SIOpinlist as pin
+
+SPIN = 2000000  # ns before a deadline where sleeping stops and spinning starts
+CHECK = 10000000    # ns a cancelled fire() may sleep on before it returns
+
+# offset in ns from t0, pin, level to drive, name for the report
+Edge = namedtuple('Edge', 'offset pin level name')
+
+# validated, immutable cycle: edges is a sorted tuple, exittime in seconds,
+# delay the ns latency compensation moved the cycle later (see compensate())
+Plan = namedtuple('Plan', 'edges exittime delay', defaults=(0,))
+
+# level of every output when the cycle starts, the cannon is advanced at power up
+INITIAL = {pin.cannon: 0, pin.cannonposition: 1, pin.plunger: 0, pin.sensorpower: 1}
+
+# level every actuator is driven to on abort: spray off, cannon reversed, plunger held
+SAFE = {pin.cannon: 0, pin.cannonposition: 0, pin.plunger: 0}
+
+# actuator states that must not overlap in time by more than the allowed ns:
+# (pin, level), (pin, level), allowed, message
+CONFLICTS = [((pin.cannonposition, 1), (pin.plunger, 1), 0,
+              "The cannon does not have sufficient time to reverse before plunging!!"),
+             ((pin.cannon, 1), (pin.cannonposition, 0), 0,
+              "Spraying with the cannon reversed")]
+
+def ns(seconds):
+    return round(seconds * 1e9)
+
+def sprayandplunge(stime, sdelay=0, pdelay=0, donotplunge=False, kuhnketime=1,
+                   cannon=pin.cannon, plunger=pin.plunger,
+                   cannonposition=pin.cannonposition, sensorpower=pin.sensorpower):
+    """Edges of one spray and plunge cycle, sorted by offset"""
+    cannonreversedelay = stime + sdelay
+    exittime = kuhnketime + pdelay + sdelay
+    edges = [Edge(ns(sdelay), cannon, 1, 'spray on'),
+             Edge(ns(sdelay + stime), cannon, 0, 'spray off'),
+             Edge(ns(cannonreversedelay), cannonposition, 0, 'cannon reverse')]
+    if not donotplunge:
+        edges.append(Edge(ns(pdelay), plunger, 1, 'plunger release'))
+    # Kuhnke plunger: withdraw it to avoid overheating
+    edges.append(Edge(ns(exittime), plunger, 0, 'plunger reset'))
+    edges.append(Edge(ns(exittime), sensorpower, 0, 'sensor power off'))
+    # stable sort keeps the order above for edges due at the same time
+    return sorted(edges, key=lambda edge: edge.offset)
+
+def intervals(edges, initial=INITIAL):
+    """{(pin, level): [(start, end), ...]} half-open ns intervals each output
+    spends at each level; the last one of a pin runs to infinity
+    """
+    levels = {}
+    since = {}
+    for p, level in initial.items():
+        levels[p], since[p] = level, float('-inf')
+    spans = {}
+    for edge in edges:
+        previous = levels.get(edge.pin, 0)
+        if edge.level != previous:
+            spans.setdefault((edge.pin, previous), []).append((since.get(edge.pin, float('-inf')), edge.offset))
+            levels[edge.pin], since[edge.pin] = edge.level, edge.offset
+    for p, level in levels.items():
+        spans.setdefault((p, level), []).append((since[p], float('inf')))
+    return spans
+
+def check(edges, conflicts=CONFLICTS, initial=INITIAL):
+    """Raise ValueError if the edges are unordered, start before t0 or put two
+    conflicting actuator states in overlap
+    """
+    if any(b.offset < a.offset for a, b in zip(edges, edges[1:])):
+        raise ValueError("Edges are not sorted by time")
+    if edges and edges[0].offset < 0:
+        raise ValueError(f"{edges[0].name} is due before the start of the cycle")
+    spans = intervals(edges, initial)
+    for first, second, allowed, message in conflicts:
+        for start, end in spans.get(first, []):
+            if any(min(end, e) - max(start, s) > allowed for s, e in spans.get(second, [])):
+                raise ValueError(message)
+
+def compensate(edges, latencies):
+    """Move every edge earlier by the latency in ns of its pin ({pin: ns}), then
+    all of them later together so none is due before t0; what the actuators do
+    then keeps the requested intervals. Returns (sorted edges, ns of that delay)
+    """
+    if not latencies:
+        return list(edges), 0
+    shifted = [edge._replace(offset=edge.offset - latencies.get(edge.pin, 0)) for edge in edges]
+    delay = max(0, -min(edge.offset for edge in shifted))
+    shifted = [edge._replace(offset=edge.offset + delay) for edge in shifted]
+    return sorted(shifted, key=lambda edge: edge.offset), delay
+
+@functools.lru_cache(maxsize=32)
+def plan(stime, sdelay=0, pdelay=0, donotplunge=False, kuhnketime=1, latencies=()):
+    """Checked Plan of a spray and plunge cycle, raises ValueError if it is unsafe;
+    latencies ((pin, ns), ...) are compensated, see compensate(). The check is
+    on the requested timeline, which is when the actuators move. Cached, so
+    repeated shots with the same settings cost a dictionary lookup
+    """
+    edges = sprayandplunge(stime, sdelay, pdelay, donotplunge, kuhnketime)
+    check(edges)
+    edges, delay = compensate(edges, dict(latencies))
+    edges = tuple(edges)
+    return Plan(edges, kuhnketime + pdelay + sdelay + delay / 1e9, delay)
+
+class Cancel:
+    """Stops fire() from another thread: once abort() returns no further edge
+    is driven and the actuators are in the SAFE state. Not from a signal
+    handler, which may have interrupted fire() in the middle of an edge
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        # held by fire() only while it drives an edge
+        self.lock = threading.Lock()
+        self.requested = None
+        self.safe = None
+        self.stops = []
+
+    def is_set(self):
+        return self.event.is_set()
+
+    def onabort(self, stop):
+        """stop() is called by abort() before the pins are driven safe, for
+        edges driven by something other than fire() such as a wave engine
+        """
+        with self.lock:
+            self.stops.append(stop)
+
+    def set(self):
+        """Cancel without touching the pins"""
+        self.event.set()
+
+    def abort(self, output, requested=None, safe=SAFE):
+        """Cancel and drive safe; requested (monotonic ns) is when the abort was asked for"""
+        with self.lock:
+            self.event.set()
+            for stop in self.stops:
+                stop()
+            for p, level in safe.items():
+                output(p, level)
+            if self.safe is None:
+                self.requested = requested or time.monotonic_ns()
+                self.safe = time.monotonic_ns()
+
+    def latency(self):
+        """ns from the abort request until the pins were safe, None if not aborted"""
+        return None if self.safe is None else self.safe - self.requested
+
+def waituntil(deadline, cancelled=None):
+    """Sleep until shortly before the monotonic ns deadline, then spin;
+    False if the cancelled Event was set first
+    """
+    remaining = deadline - SPIN - time.monotonic_ns()
+    if cancelled is None:
+        if remaining > 0:
+            time.sleep(remaining / 1e9)
+    else:
+        # Cancel.abort() drives the pins itself, the sleep only has to end soon after
+        while remaining > 0:
+            if cancelled.is_set():
+                return False
+            time.sleep(min(remaining, CHECK) / 1e9)
+            remaining = deadline - SPIN - time.monotonic_ns()
+    while time.monotonic_ns() < deadline:
+        if cancelled is not None and cancelled.is_set():
+            return False
+    return True
+
+def fire(edges, output, t0=None, cancel=None):
+    """Drive every edge with output(pin, level) at t0 + offset, stopping at
+    the first one due after cancel was set
+    returns a list of (edge, scheduled, actual) with monotonic ns timestamps
+    """
+    if t0 is None:
+        t0 = time.monotonic_ns()
+    fired = []
+    for edge in edges:
+        deadline = t0 + edge.offset
+        if cancel is None:
+            waituntil(deadline)
+            output(edge.pin, edge.level)
+        else:
+            if not waituntil(deadline, cancel.event):
+                break
+            with cancel.lock:
+                if cancel.is_set():
+                    break
+                output(edge.pin, edge.level)
+        fired.append((edge, deadline, time.monotonic_ns()))
+    return fired
+
+def report(fired, t0):
+    """Print scheduled and actual time of every fired edge"""
+    print("Edges (scheduled / actual / error):")
+    for edge, scheduled, actual in fired:
+        print(f"  {edge.name:<17} {(scheduled - t0) / 1e6:10.3f} ms "
+              f"{(actual - t0) / 1e6:10.3f} ms {(actual - scheduled) / 1e3:8.1f} us")
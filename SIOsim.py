@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# simulated SIO hardware on a virtual clock: time.sleep/time.time/monotonic
+# are patched so a sequence takes a fraction of its real duration. Models the
+# interlock reed switch, the plunger IR sensor firing a set time after the
+# plunger is released and the power rails from SIOpinlist. Run it directly to
+# push thousands of random sequences, interlock failures, containers lifted
+# mid-shot, aborts (timed in software and by waves) and IR timeouts through
+# SIOpowerupdown and SIOapplyandplunge.
+
+import io, re, sys, time, heapq, random, itertools, threading
+import argparse
+from contextlib import redirect_stdout
+import SIOpinlist as pin
+import SIOmockgpio
+
+def ns(seconds):
+    return round(seconds * 1e9)
+
+class VirtualClock:
+    """Monotonic ns clock that only moves when it is slept on or read"""
+    def __init__(self, tick=10000, epoch=1.7e9):
+        self.now = 0
+        self.tick = tick      # ns every read costs, so spin loops make progress
+        self.epoch = epoch
+        self.queue = []
+        self.order = itertools.count()
+        self.lock = threading.RLock()
+        self.saved = None
+
+    def schedule(self, at, callback):
+        """Call callback() when the clock reaches `at` ns"""
+        with self.lock:
+            heapq.heappush(self.queue, (at, next(self.order), callback))
+
+    def advance(self, target):
+        while True:
+            with self.lock:
+                if not self.queue or self.queue[0][0] > target:
+                    self.now = max(self.now, target)
+                    return
+                at, _, callback = heapq.heappop(self.queue)
+                self.now = max(self.now, at)
+            # unlocked: an abort waits for the wave thread, which reads the clock
+            callback()
+
+    def monotonic_ns(self):
+        self.advance(self.now + self.tick)
+        return self.now
+
+    def monotonic(self):
+        return self.monotonic_ns() / 1e9
+
+    def time(self):
+        return self.epoch + self.monotonic()
+
+    def sleep(self, seconds):
+        self.advance(self.now + max(0, ns(seconds)))
+
+    def install(self):
+        """Patch the time module, every caller of time.xxx() then sees this clock"""
+        names = ('sleep', 'time', 'monotonic', 'monotonic_ns', 'perf_counter', 'perf_counter_ns')
+        self.saved = {name: getattr(time, name) for name in names}
+        time.sleep = self.sleep
+        time.time = self.time
+        time.monotonic = time.perf_counter = self.monotonic
+        time.monotonic_ns = time.perf_counter_ns = self.monotonic_ns
+
+    def uninstall(self):
+        for name, function in self.saved.items():
+            setattr(time, name, function)
+
+class SimulatedGPIO(SIOmockgpio.RecordingGPIO):
+    """RecordingGPIO wired to a model of the SIO hardware"""
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.reset()
+
+    def reset(self, irdelay=0.05, seated=True):
+        """Fresh hardware state; irdelay None means the IR sensor never fires"""
+        self.records = []
+        self.levels = {}
+        self.irdelay = irdelay
+        self.levels[pin.interlock] = 0 if seated else 1   # reed switch pulls the pin down
+        self.levels[pin.irsensor] = 0
+
+    def powered(self, rail):
+        return self.levels.get(rail, 0) == 1
+
+    def input(self, channel):
+        if channel == pin.irsensor and not self.powered(pin.sensorpower):
+            return 0
+        return super().input(channel)
+
+    def output(self, channel, level):
+        # stamped without reading the clock, which would run the callbacks due,
+        # an abort among them, inside the caller's cancel lock
+        self.records.append((self.clock.now, channel, int(level)))
+        self.levels[channel] = int(level)
+        if channel == pin.plunger and self.irdelay is not None:
+            # plunger reaches (or leaves) the IR sensor irdelay after the solenoid
+            self.clock.schedule(self.clock.now + ns(self.irdelay), lambda: self.moveplunger(int(level)))
+
+    def moveplunger(self, level):
+        """The plunger moves whatever the sensor power, edges are only seen when it is on"""
+        if self.powered(pin.sensorpower):
+            self.set_input(pin.irsensor, level)
+        else:
+            self.levels[pin.irsensor] = level
+
+    def unseat(self, after):
+        """Lift the cryogen container `after` seconds from now"""
+        self.clock.schedule(self.clock.now + ns(after), lambda: self.set_input(pin.interlock, 1))
+
+clock = None
+gpio = None
+
+def install(tick=10000):
+    """Install the virtual clock and the simulated GPIO as RPi.GPIO, once"""
+    global clock, gpio
+    if gpio is None:
+        clock = VirtualClock(tick)
+        gpio = SimulatedGPIO(clock)
+        clock.install()
+        SIOmockgpio.install(gpio)
+    return gpio
+
+def runone(rng, scenario):
+    """One Ready + Spray & Plunge cycle, returns a list of problems found"""
+    import SIOpowerupdown, SIOapplyandplunge, SIOsequencer
+    stime = rng.uniform(0.001, 0.05)
+    sdelay = rng.choice([0, rng.uniform(0, 0.01)])
+    pdelay = stime + sdelay + rng.uniform(0.001, 0.1)
+    irdelay = rng.uniform(0.02, 0.2)
+    gpio.reset(irdelay=None if scenario == 'timeout' else irdelay, seated=scenario != 'interlock')
+
+    with redirect_stdout(io.StringIO()) as out:
+        up = SIOpowerupdown.powerupdown('up')
+        if scenario == 'unseat':
+            lifted = rng.uniform(0, pdelay)
+            gpio.unseat(lifted)
+            lifted = clock.now + ns(lifted)
+        waves = False
+        if scenario == 'abort':
+            waves = rng.random() < 0.5
+            # when abort() returned, no edge may be driven after that
+            aborted = []
+            clock.schedule(clock.now + ns(rng.uniform(0, pdelay)),
+                           lambda: (SIOapplyandplunge.abort(), aborted.append(clock.monotonic_ns())))
+        ok = SIOapplyandplunge.applyandplunge(stime, sdelay, pdelay, waves=waves, feedforward=False)
+    text = out.getvalue()
+    driven = {}
+    for timestamp, channel, level in gpio.records:
+        driven.setdefault((channel, level), []).append(timestamp)
+
+    if scenario == 'interlock':
+        if up or ok:
+            return ["ran with the interlock open"]
+        if (pin.plunger, 1) in driven or (pin.cannon, 1) in driven:
+            return ["fired an actuator with the interlock open"]
+        return []
+
+    if scenario == 'unseat':
+        problems = []
+        if ok:
+            problems.append("shot completed with the container lifted")
+        # lifted before the interlock check at arming, the shot is refused instead
+        if "cryogen container moved" not in text and "cryogen container is not in place" not in text:
+            problems.append("lifted container not reported")
+        # allow for an edge already on its way out
+        late = [t for p in (pin.cannon, pin.plunger) for t in driven.get((p, 1), []) if t > lifted + 100000]
+        if late:
+            problems.append("fired an actuator after the container was lifted")
+        unsafe = [p for p, level in SIOsequencer.SAFE.items() if gpio.levels.get(p, 0) != level]
+        if unsafe:
+            problems.append(f"pins {unsafe} not safe after the abort")
+        return problems
+
+    if scenario == 'abort':
+        problems = []
+        if ok:
+            problems.append("shot completed after an abort")
+        # the edges reported as fired must be the ones that were driven
+        reported = set(re.findall(r"^  (.+?)\s+-?[\d.]+ ms", text, re.M))
+        for edge in SIOsequencer.sprayandplunge(stime, sdelay, pdelay):
+            if edge.level == 0:
+                continue    # the abort drives these too
+            was = bool(driven.get((edge.pin, edge.level)))
+            if edge.name in reported and not was:
+                problems.append(f"{edge.name} reported but not driven ({'waves' if waves else 'software'})")
+            if was and edge.name not in reported:
+                problems.append(f"{edge.name} driven but not reported ({'waves' if waves else 'software'})")
+            if aborted and any(t > aborted[0] for t in driven.get((edge.pin, edge.level), [])):
+                problems.append(f"{edge.name} driven after the abort ({'waves' if waves else 'software'})")
+        unsafe = [p for p, level in SIOsequencer.SAFE.items() if gpio.levels.get(p, 0) != level]
+        if unsafe:
+            problems.append(f"pins {unsafe} not safe after the abort")
+        return problems
+
+    problems = []
+    if not (up and ok):
+        return ["cycle refused: " + text.strip().splitlines()[-1]]
+    edges = SIOsequencer.sprayandplunge(stime, sdelay, pdelay)
+    t0 = driven[(pin.cannon, 1)][0] - edges[0].offset
+    for edge in edges:
+        times = driven.get((edge.pin, edge.level), [])
+        if not any(abs(t - t0 - edge.offset) <= 100000 for t in times):
+            problems.append(f"{edge.name} not driven on time")
+    immersion = re.search(r"Time from start to immersion: (\S+)", text)
+    if scenario == 'timeout':
+        if immersion or "No immersion detected" not in text:
+            problems.append("IR timeout not reported")
+    elif not immersion or abs(float(immersion.group(1)) - pdelay - irdelay) > 1e-3:
+        problems.append("immersion time wrong")
+    return problems
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOsim')
+    parser.add_argument('--runs', help='Number of simulated cycles',default = 1000, type=int,required=False)
+    parser.add_argument('--seed', help='Random seed',default = 0, type=int,required=False)
+    args = parser.parse_args()
+
+    realtime = time.perf_counter
+    tic = realtime()
+    # through the module, so SIOgpio sees the same clock and hardware
+    import SIOsim
+    SIOsim.install()
+    rng = random.Random(args.seed)
+    failures = 0
+    counts = {}
+    for run in range(args.runs):
+        scenario = rng.choices(['ok', 'interlock', 'timeout', 'unseat', 'abort'], weights=[8, 1, 1, 1, 1])[0]
+        counts[scenario] = counts.get(scenario, 0) + 1
+        for problem in SIOsim.runone(rng, scenario):
+            failures += 1
+            print(f"run {run} ({scenario}): {problem}")
+    print(f"{args.runs} cycles {counts}: {SIOsim.clock.now / 1e9:.1f} s simulated "
+          f"in {realtime() - tic:.1f} s, {failures} problems")
+    sys.exit(1 if failures else 0)
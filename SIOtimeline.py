@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# joined timeline of one shot: the GPIO edges the sequencer drove, the IR
+# sensor immersion edge and every camera frame of a SIOcapture clip, all on the
+# time.monotonic_ns() clock and shown relative to t0. Spray onset is the first
+# frame after the spray edge that differs from the frames before it, which
+# gives the actuator latencies (command -> visible spray -> plunger motion)
+# straight from the data.
+
+import csv
+import argparse
+import numpy
+
+def onset(frames, stamps, after, threshold=10):
+    """Timestamp of the first frame from `after` on whose mean absolute difference
+    to the average frame before `after` exceeds threshold, None if there is none
+    """
+    before = frames[stamps < after]
+    if not len(before):
+        return None
+    background = before.mean(axis=0)
+    for frame, stamp in zip(frames[stamps >= after], stamps[stamps >= after]):
+        if numpy.abs(frame - background).mean() > threshold:
+            return int(stamp)
+    return None
+
+def timeline(clip, threshold=10):
+    """Sorted (ns from t0, kind, name) of edges, immersion, spray onset and frames"""
+    t0 = int(clip['t0'])
+    events = [(int(t) - t0, 'edge', str(name)) for name, t in zip(clip['edge_names'], clip['edge_times'])]
+    if not numpy.isnan(clip['immersion']):
+        events.append((round(float(clip['immersion']) * 1e9), 'sensor', 'immersion'))
+    for name, t in zip(clip['edge_names'], clip['edge_times']):
+        # spray pulses, simple or from a recipe, are the edges named '... on'
+        if str(name).endswith(' on'):
+            seen = onset(clip['frames'], clip['timestamps'], t, threshold)
+            if seen is not None:
+                events.append((seen - t0, 'camera', f"{name}: visible"))
+    events += [(int(t) - t0, 'frame', f"frame {number}") for number, t in enumerate(clip['timestamps'])]
+    return sorted(events)
+
+def latencies(events):
+    """Spray edge -> visible spray and plunger release -> immersion, in ns"""
+    times = {name: t for t, kind, name in events if kind != 'frame'}
+    found = {}
+    for name, t in times.items():
+        if name.endswith(': visible') and name[:-len(': visible')] in times:
+            found[f"{name[:-len(': visible')]} -> visible"] = t - times[name[:-len(': visible')]]
+    releases = [t for t, kind, name in events if kind == 'edge' and name.endswith('release')]
+    if releases and 'immersion' in times:
+        found['plunger release -> immersion'] = times['immersion'] - releases[0]
+    return found
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Arguments for SIOtimeline')
+    parser.add_argument('clip',         help='Clip written by SIOcapture (.npz)')
+    parser.add_argument('--threshold',  help='Mean grey level change that counts as visible spray',default = 10, type=float,required=False)
+    parser.add_argument('--frames',     help='List every frame, not only the events',action = 'store_true')
+    parser.add_argument('--csv',        help='Write the joined timeline to this CSV file',default = None, required=False)
+    args = parser.parse_args()
+
+    clip = numpy.load(args.clip)
+    events = timeline(clip, args.threshold)
+    for t, kind, name in events:
+        if args.frames or kind != 'frame':
+            print(f"{t / 1e6:10.3f} ms  {kind:<7} {name}")
+    for name, latency in latencies(events).items():
+        print(f"Latency {name}: {latency / 1e6:.3f} ms")
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ms from t0', 'kind', 'name'])
+            writer.writerows([(t / 1e6, kind, name) for t, kind, name in events])
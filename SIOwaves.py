@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# hardware-timed output backend: the whole edge list of a cycle is compiled
+# into a pigpio DMA waveform, so pulse widths and the delays between edges are
+# exact to the microsecond whatever the CPU load. SoftwarePi implements the
+# part of the pigpio API used here and plays the same waveform with the
+# sequencer's deadline loop, for use without a Pi or pigpiod.
+
+import time, threading
+from collections import namedtuple
+import SIOsequencer
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+# same fields as pigpio.pulse: gpio bits to set, to clear, then delay in us
+Pulse = namedtuple('Pulse', 'gpio_on gpio_off delay')
+
+def pulses(edges):
+    """Compile a sorted edge list into pigpio-style pulses; of two opposite
+    edges of a pin in the same microsecond the later one wins, as it would
+    with the sequencer (a zero-width pulse is dropped)
+    """
+    pulse = pigpio.pulse if pigpio is not None else Pulse
+    groups = []
+    for edge in edges:
+        offset = round(edge.offset / 1000)
+        if not groups or groups[-1][0] != offset:
+            groups.append([offset, 0, 0])
+        bit = 1 << edge.pin
+        if edge.level:
+            groups[-1][1] |= bit
+            groups[-1][2] &= ~bit
+        else:
+            groups[-1][2] |= bit
+            groups[-1][1] &= ~bit
+    wave = []
+    if groups and groups[0][0] > 0:
+        wave.append(pulse(0, 0, groups[0][0]))
+    for i, (offset, on, off) in enumerate(groups):
+        nextoffset = groups[i + 1][0] if i + 1 < len(groups) else offset
+        wave.append(pulse(on, off, nextoffset - offset))
+    return wave
+
+class SoftwarePi:
+    """Stand-in for pigpio.pi that plays waveforms through output(pin, level)"""
+    def __init__(self, output):
+        self.output = output
+        self.waves = {}
+        self.pending = []
+        self.thread = None
+        self.stopped = threading.Event()
+        # held while a pulse is output, none is once wave_tx_stop() returns
+        self.lock = threading.Lock()
+        self.reached = -1   # us offset of the last pulse played
+
+    def set_mode(self, gpio, mode):
+        pass
+
+    def wave_clear(self):
+        self.waves = {}
+        self.pending = []
+
+    def wave_add_generic(self, pulses):
+        self.pending.extend(pulses)
+        return len(self.pending)
+
+    def wave_create(self):
+        wid = len(self.waves)
+        self.waves[wid] = self.pending
+        self.pending = []
+        return wid
+
+    def wave_send_once(self, wid):
+        # a stopped wave may still be sleeping, it keeps its own event
+        self.stopped = threading.Event()
+        self.reached = -1
+        self.thread = threading.Thread(target=self.play, args=(self.waves[wid], self.stopped))
+        self.thread.start()
+
+    def play(self, wave, stopped):
+        deadline = time.monotonic_ns()
+        offset = 0
+        for pulse in wave:
+            if not SIOsequencer.waituntil(deadline, stopped):
+                return
+            with self.lock:
+                if stopped.is_set():
+                    return
+                for gpio in range(32):
+                    if pulse.gpio_on >> gpio & 1:
+                        self.output(gpio, 1)
+                    if pulse.gpio_off >> gpio & 1:
+                        self.output(gpio, 0)
+                self.reached = offset
+            deadline += pulse.delay * 1000
+            offset += pulse.delay
+
+    def wave_tx_busy(self):
+        return int(self.thread is not None and self.thread.is_alive())
+
+    def wave_tx_stop(self):
+        with self.lock:
+            self.stopped.set()
+
+    def wave_delete(self, wid):
+        del self.waves[wid]
+
+connection = None
+
+def connect(output):
+    """pigpio daemon connection, or SoftwarePi when there is none; kept open,
+    a SoftwarePi plays through the output of the latest call
+    """
+    global connection
+    if connection is None:
+        if pigpio is not None:
+            connection = pigpio.pi()
+            if not connection.connected:
+                connection = None
+        if connection is None:
+            print("pigpiod not available, waveform played in software")
+            connection = SoftwarePi(output)
+    if isinstance(connection, SoftwarePi):
+        connection.output = output
+    return connection
+
+def fire(edges, output, t0=None, pi=None, cancel=None):
+    """Same contract as SIOsequencer.fire, the edges are timed by the wave engine
+    actual times are wave start + offset, the engine does not report edges back;
+    a cancelled wave is stopped and only the edges due before then are returned
+    """
+    if pi is None:
+        pi = connect(output)
+    for gpio in set(edge.pin for edge in edges):
+        pi.set_mode(gpio, 1)  # pigpio.OUTPUT
+    pi.wave_clear()
+    pi.wave_add_generic(pulses(edges))
+    wid = pi.wave_create()
+
+    if t0 is None:
+        t0 = time.monotonic_ns()
+    if cancel is None:
+        SIOsequencer.waituntil(t0)
+        start = time.monotonic_ns()
+        pi.wave_send_once(wid)
+    else:
+        # an abort stops the wave itself before it drives the pins safe
+        cancel.onabort(pi.wave_tx_stop)
+        if not SIOsequencer.waituntil(t0, cancel.event):
+            pi.wave_delete(wid)
+            return []
+        with cancel.lock:
+            if cancel.is_set():
+                pi.wave_delete(wid)
+                return []
+            start = time.monotonic_ns()
+            pi.wave_send_once(wid)
+    stopped = None
+    while pi.wave_tx_busy():
+        if cancel is not None and cancel.is_set():
+            pi.wave_tx_stop()
+            stopped = time.monotonic_ns()
+            break
+        time.sleep(0.001)
+    pi.wave_delete(wid)
+    fired = [(edge, t0 + edge.offset, start + round(edge.offset / 1000) * 1000) for edge in edges]
+    # Cancel.abort() stops the wave itself, this loop only sees it end then
+    if cancel is not None and cancel.is_set() and isinstance(pi, SoftwarePi):
+        # played in software, it may lag its schedule but knows how far it got
+        fired = [(edge, scheduled, actual) for edge, scheduled, actual in fired
+                 if round(edge.offset / 1000) <= pi.reached]
+    elif cancel is not None and cancel.is_set() and (cancel.requested or stopped):
+        fired = [(edge, scheduled, actual) for edge, scheduled, actual in fired if actual < (cancel.requested or stopped)]
+    return fired
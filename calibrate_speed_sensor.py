@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
-#import RPi.GPIO as GPIO
-import Mock.GPIO as GPIO
+from SIOgpio import GPIO
 
 pin    = 14
 
@@ -38,6 +38,11 @@ class Camera:
     def __init__(self, device_id=0):
         self.h_cam = ueye.HIDS(device_id)
         self.img_buffers = []
+        self.buffer_ids = {}
+        # written by the driver for every frame, allocated once
+        self.next_ptr = ueye.c_mem_p()
+        self.next_id = ueye.int()
+        self.info = ueye.UEYEIMAGEINFO()
 
     def __enter__(self):
         self.init()
@@ -51,10 +56,13 @@ class Camera:
 
     def alloc(self, buffer_count=3):
         rect = self.get_aoi()
-        bpp = get_bits_per_pixel(self.get_colormode())
+        colormode = self.get_colormode()
+        bpp = get_bits_per_pixel(colormode)
 
         for buff in self.img_buffers:
             check(ueye.is_FreeImageMem(self.h_cam, buff.mem_ptr, buff.mem_id))
+        self.img_buffers = []
+        self.buffer_ids = {}
 
         for i in range(buffer_count):
             buff = ImageBuffer()
@@ -63,11 +71,39 @@ class Camera:
                                   buff.mem_ptr, buff.mem_id)
             
             check(ueye.is_AddToSequence(self.h_cam, buff.mem_ptr, buff.mem_id))
+            # size, pitch and colour mode are fixed until the next alloc
+            buff.describe(self.h_cam, colormode)
+            buff.camera = self
 
             self.img_buffers.append(buff)
+            self.buffer_ids[buff.mem_id.value] = buff
 
         ueye.is_InitImageQueue(self.h_cam, 0)
 
+    def image_data(self, mem_id):
+        """Cached ImageData of the sequence buffer with this id"""
+        return self.buffer_ids[mem_id].image_data
+
+    def wait_next(self, timeout):
+        """Id of the next filled sequence buffer, locked until unlock(); None
+        if none came within timeout ms
+        """
+        ret = ueye.is_WaitForNextImage(self.h_cam, timeout, self.next_ptr, self.next_id)
+        if ret == ueye.IS_SUCCESS:
+            return self.next_id.value
+        if ret == ueye.IS_TIMED_OUT:
+            return None
+        raise uEyeException(ret)
+
+    def image_info(self, mem_id):
+        """(frame number, device timestamp in 0.1 us) of a filled buffer, None if unknown"""
+        if ueye.is_GetImageInfo(self.h_cam, mem_id, self.info, ueye.sizeof(self.info)) != ueye.IS_SUCCESS:
+            return None
+        return self.info.u64FrameNumber.value, self.info.u64TimestampDevice.value
+
+    def unlock(self, buff):
+        check(ueye.is_UnlockSeqBuf(self.h_cam, buff.mem_id, buff.mem_ptr))
+
     def init(self):
         ret = ueye.is_InitCamera(self.h_cam, None)
         if ret != ueye.IS_SUCCESS:
@@ -37,6 +37,9 @@ from PyQt4 import QtGui
 #from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QSlider, QWidget
 
 from pyueye import ueye
+import threading, time
+import numpy
+from SIOmetrics import metrics
 
 
 def get_qt_format(ueye_color_format):
@@ -52,8 +55,9 @@ def get_qt_format(ueye_color_format):
 class PyuEyeQtView(QtGui.QWidget):
 
     update_signal = QtCore.pyqtSignal(QtGui.QImage, name="update_signal")
+    status_signal = QtCore.pyqtSignal(str, name="status_signal")
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, max_fps=30):
         super(self.__class__, self).__init__(parent)
 
         self.image = None
@@ -67,45 +71,151 @@ class PyuEyeQtView(QtGui.QWidget):
         self.v_layout.addWidget(self.graphics_view)
 
         self.scene.drawBackground = self.draw_background
+        self.scene.drawForeground = self.draw_foreground
         self.scene.setSceneRect(self.scene.itemsBoundingRect())
         self.update_signal.connect(self.update_image)
 
         self.processors = []
+        self.user_callback = None
         self.resize(640, 512)
+
+        # text from any thread, e.g. analysis results, shown under the preview
+        self.status = QtGui.QLabel(self)
+        self.h_layout.addWidget(self.status)
+        self.status_signal.connect(self.status.setText)
                 
         self.v_layout.addLayout(self.h_layout)
         self.setLayout(self.v_layout)
 
+        # only the newest frame is kept: the camera thread drops the waiting
+        # frame for a newer one, the preview thread scales it down and hands
+        # it to the GUI thread at most max_fps times a second
+        self.target = (640, 512)
+        self.min_interval = 1.0 / max_fps
+        self.pending = None
+        self.shown = 0
+        self.dropped = 0
+        self.running = True
+        # SIOmetrics.Metrics to draw over the preview, None for none
+        self.overlay = None
+        self.overlay_text = []
+        self.overlay_time = 0
+        self.overlay_snapshot = None  # rates are since the previous redraw
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self.preview, daemon=True)
+        self.worker.start()
+
     def on_update_canny_1_slider(self, value):
         pass # print(value)
 
     def on_update_canny_2_slider(self, value):
         pass # print(value)
+
+    def resizeEvent(self, event):
+        size = self.graphics_view.viewport().size()
+        self.target = (size.width(), size.height())
+        super(self.__class__, self).resizeEvent(event)
         
     def draw_background(self, painter, rect):
+        # the preview thread already scaled the image to the view
         if self.image:
-            image = self.image.scaled(rect.width(), rect.height(), QtCore.Qt.KeepAspectRatio)
-            painter.drawImage(rect.x(), rect.y(), image)
+            painter.drawImage(rect.x(), rect.y(), self.image)
+
+    def draw_foreground(self, painter, rect):
+        if self.overlay is None:
+            return
+        # the text is rebuilt twice a second, not at every repaint
+        if time.monotonic() - self.overlay_time > 0.5:
+            self.overlay_snapshot = self.overlay.snapshot(self.overlay_snapshot)
+            self.overlay_text = self.overlay.report(self.overlay_snapshot)
+            self.overlay_time = time.monotonic()
+        painter.setPen(QtCore.Qt.yellow)
+        height = painter.fontMetrics().height()
+        for line, text in enumerate(self.overlay_text, 1):
+            painter.drawText(rect.x() + 4, rect.y() + line * height, text)
 
     def update_image(self, image):
+        self.image = image
         self.scene.update()
 
-    def user_callback(self, image_data):
-        return image_data.as_cv_image()
-
     def handle(self, image_data):
-        self.image = self.user_callback(self, image_data)
-        
-        self.update_signal.emit(self.image)
-
-        # unlock the buffer so we can use it again
-        image_data.unlock()
+        # camera thread: replace the waiting frame, its buffer goes back to the camera
+        with self.condition:
+            dropped, self.pending = self.pending, image_data
+            self.condition.notify()
+        if dropped is not None:
+            self.dropped += 1
+            metrics.count('preview dropped')
+            dropped.unlock()
+
+    def preview(self):
+        while self.running:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                image_data, self.pending = self.pending, None
+            if image_data is None:
+                break
+            start = time.monotonic_ns()
+            timestamp = image_data.timestamp
+            image = downsample(image_data.as_1d_image(), *self.target, image_data.color_mode)
+            # unlock the buffer so we can use it again, image is a copy
+            valid = image_data.valid()
+            image_data.unlock()
+            if not valid:
+                # overwritten in a SIOcamproc ring while it was downsampled
+                self.dropped += 1
+                metrics.count('preview dropped')
+                continue
+            if self.user_callback is not None:
+                image = self.user_callback(self, image)
+            self.update_signal.emit(to_qimage(image))
+            self.shown += 1
+            done = time.monotonic_ns()
+            metrics.count('displayed')
+            metrics.latency('preview', done - start)
+            if timestamp is not None:
+                metrics.latency('capture to display', done - timestamp)
+            # cap the repaint rate, frames arriving meanwhile replace each other
+            time.sleep(self.min_interval)
 
     def shutdown(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        print(f"Preview: {self.shown} frames shown, {self.dropped} dropped")
         self.close()
 
     def add_processor(self, callback):
         self.processors.append(callback)
+
+
+def downsample(image, width, height, color_mode=None):
+    """Contiguous copy of image shrunk by whole-pixel striding to fit width x
+    height, keeping the aspect ratio; BGR frames come back as RGB
+    """
+    step = max(1, -(-image.shape[1] // max(1, width)), -(-image.shape[0] // max(1, height)))
+    image = image[::step, ::step]
+    if color_mode == ueye.IS_CM_BGR8_PACKED:
+        image = image[:, :, ::-1]
+    return numpy.ascontiguousarray(image)
+
+
+GRAY = [QtGui.qRgb(i, i, i) for i in range(256)]
+
+def to_qimage(image):
+    """QImage of a contiguous uint8 array; a copy, so it can cross threads
+    after the array is gone (the array is only view sized)
+    """
+    height, width = image.shape[:2]
+    if image.ndim == 2:
+        qimage = QtGui.QImage(image.data, width, height, image.strides[0], QtGui.QImage.Format_Indexed8)
+        qimage.setColorTable(GRAY)
+    elif image.shape[2] == 3:
+        qimage = QtGui.QImage(image.data, width, height, image.strides[0], QtGui.QImage.Format_RGB888)
+    else:
+        qimage = QtGui.QImage(image.data, width, height, image.strides[0], QtGui.QImage.Format_RGB32)
+    return qimage.copy()
     
 
 class PyuEyeQtApp:
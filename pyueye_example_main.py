@@ -33,6 +33,8 @@
 from pyueye_example_camera import Camera
 from pyueye_example_utils import FrameThread
 from pyueye_example_gui import PyuEyeQtApp, PyuEyeQtView
+from SIOdroplets import DropletAnalyzer
+from SIOmetrics import metrics
 from PyQt4 import QtGui
 import time
 
@@ -42,34 +44,20 @@ from pyueye import ueye
 import cv2
 import numpy as np
 
-def process_image(self, image_data):
-
-    # reshape the image data as 1dimensional array
-    ##tic = time.time()
-    image = image_data.as_1d_image()#*2
-    ##print time.time()-tic
-    # make a gray image
-    ##image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    #image = cv2.medianBlur(image,5)
-    # find circles in the image # does not seem necessary
-    ###circles = cv2.HoughCircles(image, cv2.cv.CV_HOUGH_GRADIENT, 1.2, 100)
-    # make a color image again to mark the circles in green
-    ##image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-    
-    #if circles is not None:
-#	   # convert the (x, y) coordinates and radius of the circles to integers
-#	   circles = np.round(circles[0, :]).astype("int") 
-#	   # loop over the (x, y) coordinates and radius of the circles
-#	   for (x, y, r) in circles:
-#		  # draw the circle in the output image, then draw a rectangle
-#		  # corresponding to the center of the circle
-#		  cv2.circle(image, (x, y), r, (0, 255, 0), 6)
-    
-    # show the image with Qt
-    return QtGui.QImage(image.data,
-                        image_data.mem_info.width,
-                        image_data.mem_info.height,
-                        QtGui.QImage.Format_RGB888)
+def process_image(self, image):
+    # runs on the preview thread with the newest frame, already scaled down to
+    # the view and copied out of the camera buffer
+
+    # droplet detection (HoughCircles) runs in SIOdroplets on a process
+    # pool, it stalled the capture thread here
+
+    # the view turns the array into a QImage
+    return image
+
+def show_droplets(view, result):
+    # pool result thread: the signal takes the text to the GUI thread
+    view.status_signal.emit(f"frame {result['frame']}: {result['count']} droplets, "
+                            f"{100 * result['coverage']:.1f}% covered, radii {result['histogram']}")
 
 def main():
 
@@ -80,6 +68,8 @@ def main():
     view = PyuEyeQtView()
     view.show()
     view.user_callback = process_image
+    # frame rates, drops, locked buffers and latencies over the preview
+    view.overlay = metrics
 
     # camera class to simplify uEye API access
     cam = Camera()
@@ -93,12 +83,17 @@ def main():
     cam.alloc()
     cam.capture_video()
 
+    # droplet analysis gets the frames the pool has room for
+    droplets = DropletAnalyzer(cam.img_buffers[0].image.shape)
+    droplets.subscribe(lambda result: show_droplets(view, result))
+
     # a thread that waits for new images and processes all connected views
-    thread = FrameThread(cam, view)
+    thread = FrameThread(cam, [view, droplets])
     thread.start()
 
     # cleanup
     app.exit_connect(thread.stop)
+    app.exit_connect(view.shutdown)
     app.exec_()
 
     thread.stop()
@@ -106,6 +101,8 @@ def main():
 
     cam.stop_video()
     cam.exit()
+    droplets.close()
+    print("\n".join(metrics.report()))
 
 if __name__ == "__main__":
     main()
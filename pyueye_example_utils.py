@@ -30,9 +30,17 @@
 # POSSIBILITY OF SUCH DAMAGE.
 #------------------------------------------------------------------------------
 
-from pyueye import ueye
-from threading import Thread
+try:
+    from pyueye import ueye
+except ImportError:
+    ueye = None     # SIOreplay cameras run without the uEye driver
+from threading import Thread, Lock
 from ctypes import byref
+from collections import deque
+import time
+import numpy
+from SIOmetrics import metrics
+from numpy.lib.stride_tricks import as_strided
 
 def get_bits_per_pixel(color_mode):
     """
@@ -80,6 +88,33 @@ class ImageBuffer:
     def __init__(self):
         self.mem_ptr = ueye.c_mem_p()
         self.mem_id = ueye.int()
+        # filled in once by Camera.alloc, so frames need no driver queries
+        self.mem_info = None
+        self.color_mode = None
+        self.bits_per_pixel = None
+        self.image = None       # zero-copy view of the buffer memory
+        self.image_data = None
+        self.camera = None      # unlocks the buffer, set by Camera.alloc
+
+    def describe(self, h_cam, color_mode):
+        """Cache size, pitch and colour mode and map the memory as a numpy view"""
+        self.mem_info = MemoryInfo(h_cam, self)
+        self.color_mode = color_mode
+        self.bits_per_pixel = get_bits_per_pixel(color_mode)
+        flat = ueye.get_data(self.mem_ptr, self.mem_info.width, self.mem_info.height,
+                             self.mem_info.bits, self.mem_info.pitch, False)
+        self.image = image_view(flat, self.mem_info, self.bits_per_pixel)
+        self.image_data = ImageData(h_cam, self)
+
+
+def image_view(flat, mem_info, bits_per_pixel):
+    """(height, width[, channels]) uint8 view of a buffer, rows are pitch bytes apart"""
+    channels = int((7 + bits_per_pixel) / 8)
+    flat = numpy.frombuffer(flat, numpy.uint8)
+    shape = (mem_info.height, mem_info.width, channels)
+    strides = (mem_info.pitch.value, channels, 1)
+    view = as_strided(flat, shape, strides, writeable=False)
+    return view if channels > 1 else view[:, :, 0]
 
 
 class MemoryInfo:
@@ -105,27 +140,56 @@ class ImageData:
     def __init__(self, h_cam, img_buff):
         self.h_cam = h_cam
         self.img_buff = img_buff
+        self.frame = None       # set per frame by FrameThread
+        self.timestamp = None   # capture time, time.monotonic_ns() clock
+        self.holders = 0        # views that still have to unlock() this frame
+        self.arrival = None     # when FrameThread got it, time.monotonic_ns()
+        self.holders_lock = Lock()
+        if img_buff.image is not None:
+            # buffer described by Camera.alloc: no driver calls, no copy
+            self.mem_info = img_buff.mem_info
+            self.color_mode = img_buff.color_mode
+            self.bits_per_pixel = img_buff.bits_per_pixel
+            self.image = img_buff.image
+            return
         self.mem_info = MemoryInfo(h_cam, img_buff)
         self.color_mode = ueye.is_SetColorMode(h_cam, ueye.IS_GET_COLOR_MODE)
         self.bits_per_pixel = get_bits_per_pixel(self.color_mode)
-        self.array = ueye.get_data(self.img_buff.mem_ptr,
-                                   self.mem_info.width,
-                                   self.mem_info.height,
-                                   self.mem_info.bits,
-                                   self.mem_info.pitch,
-                                   True)
-
-    def as_1d_image(self):        
-        channels = int((7 + self.bits_per_pixel) / 8)
-        import numpy
-        if channels > 1:
-            return numpy.reshape(self.array, (self.mem_info.height, self.mem_info.width, channels))
-        else:
-            return numpy.reshape(self.array, (self.mem_info.height, self.mem_info.width))
+        self.image = image_view(ueye.get_data(self.img_buff.mem_ptr,
+                                              self.mem_info.width,
+                                              self.mem_info.height,
+                                              self.mem_info.bits,
+                                              self.mem_info.pitch,
+                                              True),
+                                self.mem_info, self.bits_per_pixel)
+
+    def as_1d_image(self):
+        """The frame as a view of the locked buffer, only valid until unlock()"""
+        return self.image
+
+    def copy(self):
+        """The frame as an array of its own, for consumers that keep it after unlock()"""
+        return numpy.array(self.image)
+
+    def valid(self):
+        """Always, the locked buffer does not change before unlock() (a frame
+        read from a SIOcamproc ring may)
+        """
+        return True
 
 
     def unlock(self):
-        check(ueye.is_UnlockSeqBuf(self.h_cam, self.img_buff.mem_id, self.img_buff.mem_ptr))
+        """Every view unlocks the frame once, the buffer goes back to the camera after the last"""
+        with self.holders_lock:
+            self.holders -= 1
+            if self.holders > 0:
+                return
+        if self.arrival is not None:
+            metrics.latency('buffer hold', time.monotonic_ns() - self.arrival)
+        if self.img_buff.camera is not None:
+            self.img_buff.camera.unlock(self.img_buff)
+        else:
+            check(ueye.is_UnlockSeqBuf(self.h_cam, self.img_buff.mem_id, self.img_buff.mem_ptr))
 
 class Rect:
     def __init__(self, x=0, y=0, width=0, height=0):
@@ -136,33 +200,91 @@ class Rect:
 
 
 
+class ClockMap:
+    """Maps the camera's device timestamps (0.1 us ticks) onto time.monotonic_ns()
+    the offset is the smallest arrival - capture difference of the last `window`
+    frames, i.e. the frame that reached us fastest, which follows clock drift;
+    mapped times are late by that frame's transfer time
+    """
+    def __init__(self, window=500):
+        self.window = window
+        self.samples = deque()  # (frame, offset) with increasing offsets
+        self.frames = 0
+
+    def add(self, device, arrival):
+        """Monotonic ns capture time of a frame with this device timestamp that arrived at `arrival`"""
+        offset = arrival - device * 100
+        # sliding window minimum: drop samples that can no longer be the minimum
+        while self.samples and self.samples[-1][1] >= offset:
+            self.samples.pop()
+        self.samples.append((self.frames, offset))
+        if self.samples[0][0] <= self.frames - self.window:
+            self.samples.popleft()
+        self.frames += 1
+        return device * 100 + self.samples[0][1]
+
+
 class FrameThread(Thread):
     def __init__(self, cam, views=None, copy=True):
         super(FrameThread, self).__init__()
         self.timeout = 1000
         self.cam = cam
         self.running = True
+        if views is not None and type(views) is not list:
+            views = [views]
         self.views = views
         self.copy = copy
 
     def run(self):
+        # the frame is served from the cached ImageData of the filled buffer
+        clock = ClockMap()
+        previous = None
+        failures = 0
         while self.running:
-            img_buffer = ImageBuffer()
-            ret = ueye.is_WaitForNextImage(self.cam.handle(),
-                                           self.timeout,
-                                           img_buffer.mem_ptr,
-                                           img_buffer.mem_id)
-            if ret == ueye.IS_SUCCESS:
-                self.notify(ImageData(self.cam.handle(), img_buffer))
+            try:
+                mem_id = self.cam.wait_next(self.timeout)
+            except uEyeException:
+                metrics.count('capture errors')
+                # unplugged or a driver stuck in error fails at once: back off
+                # (1 ms doubling up to 1 s) rather than spin next to the shot timing
+                failures += 1
+                time.sleep(min(1.0, 0.001 * 2 ** min(failures - 1, 10)))
+                continue
+            failures = 0
+            if mem_id is None:
+                metrics.count('timeouts')
+                continue
+            arrival = time.monotonic_ns()
+            image_data = self.cam.image_data(mem_id)
+            image_data.arrival = arrival
+            # capture time on the clock the GPIO sequencer uses
+            info = self.cam.image_info(mem_id)
+            if info is not None:
+                image_data.frame, device = info
+                image_data.timestamp = clock.add(device, arrival)
+                if previous is not None and image_data.frame > previous + 1:
+                    # frame numbers the camera skipped, no buffer was free
+                    metrics.count('camera dropped', image_data.frame - previous - 1)
+                previous = image_data.frame
+            else:
+                image_data.frame = None
+                image_data.timestamp = arrival
+            metrics.count('captured')
+            metrics.latency('capture to arrival', arrival - image_data.timestamp)
+            metrics.gauge('locked buffers', sum(1 for buff in self.cam.img_buffers
+                                                if buff.image_data.holders > 0) + 1)
+            self.notify(image_data)
+            metrics.latency('dispatch', time.monotonic_ns() - arrival)
 
             #break
 
     def notify(self, image_data):
         if self.views:
-            if type(self.views) is not list:
-                self.views = [self.views]
+            image_data.holders = len(self.views)
             for view in self.views:
                 view.handle(image_data)
+        else:
+            image_data.unlock()
 
     def stop(self):
         self.cam.stop_video()